@@ -0,0 +1,28 @@
+"""add posts keyset index
+
+Revision ID: 108fac76526e
+Revises: 3c1eb502a552
+Create Date: 2026-10-18 11:03:27.552108
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '108fac76526e'
+down_revision: Union[str, None] = '3c1eb502a552'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_posts_created_at_id', 'posts', ['created_at', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_posts_created_at_id', table_name='posts')
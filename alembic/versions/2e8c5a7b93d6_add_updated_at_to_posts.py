@@ -0,0 +1,30 @@
+"""add updated_at to posts
+
+Revision ID: 2e8c5a7b93d6
+Revises: 9d4a6f1c8e27
+Create Date: 2026-10-18 16:48:13.402587
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2e8c5a7b93d6'
+down_revision: Union[str, None] = '9d4a6f1c8e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False))
+    # Existing posts have no modification history, so start them at created_at
+    op.execute("UPDATE posts SET updated_at = created_at")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('posts', 'updated_at')
@@ -0,0 +1,36 @@
+"""add vote_count to posts
+
+Revision ID: 3c1eb502a552
+Revises: fdf7a397fb5a
+Create Date: 2026-10-18 10:12:41.318224
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1eb502a552'
+down_revision: Union[str, None] = 'fdf7a397fb5a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('vote_count', sa.Integer(), server_default='0', nullable=False))
+    # Backfill the counter from the existing votes
+    op.execute(
+        """
+        UPDATE posts SET vote_count = counts.votes
+        FROM (SELECT post_id, count(*) AS votes FROM votes GROUP BY post_id) AS counts
+        WHERE posts.id = counts.post_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('posts', 'vote_count')
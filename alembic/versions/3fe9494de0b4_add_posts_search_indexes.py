@@ -0,0 +1,39 @@
+"""add posts search indexes
+
+Revision ID: 3fe9494de0b4
+Revises: 108fac76526e
+Create Date: 2026-10-18 11:47:09.204815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3fe9494de0b4'
+down_revision: Union[str, None] = '108fac76526e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Both indexes are over the same document expression that
+    # routers/post.py searches, (title || ' ' || content)
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        "CREATE INDEX ix_posts_search_fulltext ON posts "
+        "USING gin (to_tsvector('english', title || ' ' || content))"
+    )
+    op.execute(
+        "CREATE INDEX ix_posts_search_trigram ON posts "
+        "USING gin ((title || ' ' || content) gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX ix_posts_search_trigram")
+    op.execute("DROP INDEX ix_posts_search_fulltext")
@@ -0,0 +1,36 @@
+"""add post rankings
+
+Revision ID: 5b7e2c9d41f3
+Revises: 3fe9494de0b4
+Create Date: 2026-10-18 15:12:40.218374
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e2c9d41f3'
+down_revision: Union[str, None] = '3fe9494de0b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'post_rankings',
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('post_id'),
+    )
+    op.create_index('ix_post_rankings_score_post_id', 'post_rankings', ['score', 'post_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_post_rankings_score_post_id', table_name='post_rankings')
+    op.drop_table('post_rankings')
@@ -0,0 +1,43 @@
+"""add user stats
+
+Revision ID: 7f3b9e2a6c15
+Revises: 2e8c5a7b93d6
+Create Date: 2026-10-18 17:31:26.918340
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3b9e2a6c15'
+down_revision: Union[str, None] = '2e8c5a7b93d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'user_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('post_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('votes_received', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('last_post_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    # Backfill from the existing posts
+    op.execute(
+        """
+        INSERT INTO user_stats (user_id, post_count, votes_received, last_post_at)
+        SELECT owner_id, count(*), sum(vote_count), max(created_at) FROM posts GROUP BY owner_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_stats')
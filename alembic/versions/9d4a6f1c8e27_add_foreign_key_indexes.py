@@ -0,0 +1,30 @@
+"""add foreign key indexes
+
+Revision ID: 9d4a6f1c8e27
+Revises: 5b7e2c9d41f3
+Create Date: 2026-10-18 16:05:51.730942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4a6f1c8e27'
+down_revision: Union[str, None] = '5b7e2c9d41f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_posts_owner_id', 'posts', ['owner_id'])
+    op.create_index('ix_votes_post_id', 'votes', ['post_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_votes_post_id', table_name='votes')
+    op.drop_index('ix_posts_owner_id', table_name='posts')
@@ -0,0 +1,282 @@
+import asyncio
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from starlette.concurrency import run_in_threadpool
+from . import oauth2, utils
+
+# Bulk import of users, posts and votes. Each batch is COPYed into a temporary
+# staging table and merged into the real table with one set-based INSERT, in
+# its own transaction. A checkpoint row records finished batches so an
+# interrupted import can resume where it stopped.
+
+class RowError(ValueError):
+    # A row that cannot be read or parsed, numbered from 1 in input order
+    def __init__(self, row: int, message: str):
+        super().__init__(f"row {row}: {message}")
+        self.row = row
+        self.message = message
+
+def _parse_bool(value) -> Optional[bool]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "t", "true", "yes", "y")
+
+def _parse_int(value) -> Optional[int]:
+    return None if value is None or value == "" else int(value)
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def _parse_str(value) -> Optional[str]:
+    return None if value is None or value == "" else str(value)
+
+def _hash_many(passwords):
+    # Runs in a worker process
+    return [utils.hash(password) for password in passwords]
+
+class Importer:
+    # staging: (column, SQL type, parser) in COPY order
+    # merge: INSERT ... SELECT from the staging table into the real table,
+    # returning one row per row inserted
+    staging = ()
+    merge = ""
+
+    def __init__(self, hash_executor: Optional[ProcessPoolExecutor] = None):
+        self.hash_executor = hash_executor
+
+    async def prepare(self, rows):
+        return rows
+
+    def records(self, rows, first_row: int = 1):
+        records = []
+        for number, row in enumerate(rows, first_row):
+            record = []
+            for column, _, parse in self.staging:
+                try:
+                    record.append(parse(row.get(column)))
+                except (TypeError, ValueError) as error:
+                    raise RowError(number, f"{column}: {error}") from None
+            records.append(tuple(record))
+        return records
+
+    async def after_merge(self, conn: AsyncConnection, inserted):
+        pass
+
+class UserImporter(Importer):
+    staging = (
+        ("email", "text", _parse_str),
+        ("password", "text", _parse_str),
+        ("created_at", "timestamptz", _parse_datetime),
+    )
+    merge = """
+        INSERT INTO users (email, password, created_at)
+        SELECT DISTINCT ON (email) email, password, coalesce(created_at, now()) FROM staging
+        WHERE email IS NOT NULL AND password IS NOT NULL
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id
+    """
+
+    async def prepare(self, rows):
+        # Rows carry either a bcrypt password_hash or a plain password to hash.
+        # Hashing is the slow part, so it is spread over worker processes
+        to_hash = [row for row in rows if not row.get("password_hash") and row.get("password")]
+        for row in rows:
+            if row.get("password_hash"):
+                row["password"] = row["password_hash"]
+        if to_hash:
+            loop = asyncio.get_running_loop()
+            workers = self.hash_executor._max_workers if self.hash_executor else os.cpu_count() or 1
+            chunk_size = max(1, len(to_hash) // (workers * 4) + 1)
+            chunks = [to_hash[i:i + chunk_size] for i in range(0, len(to_hash), chunk_size)]
+            hashed = await asyncio.gather(*(
+                loop.run_in_executor(self.hash_executor, _hash_many, [str(row["password"]) for row in chunk])
+                for chunk in chunks
+            ))
+            for chunk, hashes in zip(chunks, hashed):
+                for row, password_hash in zip(chunk, hashes):
+                    row["password"] = password_hash
+        return rows
+
+    async def after_merge(self, conn: AsyncConnection, inserted):
+        for row in inserted:
+            oauth2.invalidate_user(row[0])
+
+class PostImporter(Importer):
+    # The owner is given as owner_id or owner_email
+    staging = (
+        ("title", "text", _parse_str),
+        ("content", "text", _parse_str),
+        ("published", "boolean", _parse_bool),
+        ("created_at", "timestamptz", _parse_datetime),
+        ("owner_id", "integer", _parse_int),
+        ("owner_email", "text", _parse_str),
+    )
+    merge = """
+        INSERT INTO posts (title, content, published, created_at, owner_id)
+        SELECT s.title, s.content, coalesce(s.published, true), coalesce(s.created_at, now()), u.id
+        FROM staging s
+        LEFT JOIN users by_email ON by_email.email = s.owner_email
+        JOIN users u ON u.id = coalesce(s.owner_id, by_email.id)
+        WHERE s.title IS NOT NULL AND s.content IS NOT NULL
+        RETURNING id, owner_id, created_at
+    """
+
+    async def after_merge(self, conn: AsyncConnection, inserted):
+        # Count the new posts in their owners' user_stats
+        if inserted:
+            await conn.execute(text("""
+                INSERT INTO user_stats (user_id, post_count, last_post_at)
+                SELECT owner_id, count(*), max(created_at)
+                FROM unnest(CAST(:owner_ids AS integer[]), CAST(:created_at AS timestamptz[])) AS new(owner_id, created_at)
+                GROUP BY owner_id
+                ON CONFLICT (user_id) DO UPDATE SET post_count = user_stats.post_count + excluded.post_count,
+                    last_post_at = greatest(user_stats.last_post_at, excluded.last_post_at)
+            """), {"owner_ids": [row[1] for row in inserted], "created_at": [row[2] for row in inserted]})
+
+class VoteImporter(Importer):
+    # The voter is given as user_id or user_email
+    staging = (
+        ("user_id", "integer", _parse_int),
+        ("user_email", "text", _parse_str),
+        ("post_id", "integer", _parse_int),
+    )
+    merge = """
+        INSERT INTO votes (user_id, post_id)
+        SELECT DISTINCT u.id, p.id
+        FROM staging s
+        LEFT JOIN users by_email ON by_email.email = s.user_email
+        JOIN users u ON u.id = coalesce(s.user_id, by_email.id)
+        JOIN posts p ON p.id = s.post_id
+        ON CONFLICT DO NOTHING
+        RETURNING post_id
+    """
+
+    async def after_merge(self, conn: AsyncConnection, inserted):
+        # Keep the denormalized posts.vote_count and the owners' votes_received
+        # in step with the new votes
+        if inserted:
+            await conn.execute(text("""
+                WITH counted AS (
+                    UPDATE posts SET vote_count = posts.vote_count + added.votes, updated_at = now()
+                    FROM (SELECT post_id, count(*) AS votes FROM unnest(CAST(:post_ids AS integer[])) AS post_id GROUP BY post_id) AS added
+                    WHERE posts.id = added.post_id
+                    RETURNING posts.owner_id, added.votes
+                )
+                UPDATE user_stats SET votes_received = user_stats.votes_received + owners.votes
+                FROM (SELECT owner_id, sum(votes) AS votes FROM counted GROUP BY owner_id) AS owners
+                WHERE user_stats.user_id = owners.owner_id
+            """), {"post_ids": [row[0] for row in inserted]})
+
+IMPORTERS = {
+    "users": UserImporter,
+    "posts": PostImporter,
+    "votes": VoteImporter,
+}
+
+def read_rows(lines: Iterable[str], format: str) -> Iterator[dict]:
+    rows = csv.DictReader(lines) if format == "csv" else (line for line in lines if line.strip())
+    number = 0
+    while True:
+        number += 1
+        try:
+            row = next(rows)
+            if format != "csv":
+                row = json.loads(row)
+                if not isinstance(row, dict):
+                    raise ValueError("not a JSON object")
+        except StopIteration:
+            return
+        except (csv.Error, ValueError) as error:
+            # Including undecodable bytes and malformed JSON
+            raise RowError(number, str(error)) from None
+        yield row
+
+class Checkpoint:
+    # Number of finished batches for an import, kept in import_checkpoints
+    # under its name and advanced in the same transaction as each batch, so a
+    # crash can neither lose a batch nor have the resume insert it again.
+    # Without a name nothing is recorded
+    def __init__(self, name: Optional[str], key: dict):
+        self.name = name
+        self.key = json.dumps(key, sort_keys=True)
+        self.batches_done = 0
+
+    async def load(self, conn: AsyncConnection):
+        if self.name:
+            saved = (await conn.execute(text("SELECT key, batches_done FROM import_checkpoints WHERE name = :name"),
+                                        {"name": self.name})).first()
+            self.batches_done = saved.batches_done if saved is not None and saved.key == self.key else 0
+
+    async def save(self, conn: AsyncConnection, batches_done: int):
+        if self.name:
+            await conn.execute(text("""
+                INSERT INTO import_checkpoints (name, key, batches_done) VALUES (:name, :key, :batches_done)
+                ON CONFLICT (name) DO UPDATE SET key = excluded.key, batches_done = excluded.batches_done, updated_at = now()
+            """), {"name": self.name, "key": self.key, "batches_done": batches_done})
+        self.batches_done = batches_done
+
+def _skip(rows: Iterator[dict], count: int) -> int:
+    return sum(1 for _ in itertools.islice(rows, count))
+
+def _take(rows: Iterator[dict], count: int) -> list:
+    return list(itertools.islice(rows, count))
+
+async def _import_batch(engine: AsyncEngine, importer: Importer, rows, first_row: int,
+                        checkpoint: Checkpoint, batches_done: int) -> int:
+    # Parsing is CPU-bound, so it runs in a thread like the reading
+    records = await run_in_threadpool(importer.records, await importer.prepare(rows), first_row)
+    async with engine.begin() as conn:
+        columns = ", ".join(f"{column} {type}" for column, type, _ in importer.staging)
+        await conn.execute(text(f"CREATE TEMPORARY TABLE staging ({columns}) ON COMMIT DROP"))
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            "staging", records=records, columns=[column for column, _, _ in importer.staging])
+        inserted = (await conn.execute(text(importer.merge))).all()
+        await importer.after_merge(conn, inserted)
+        await checkpoint.save(conn, batches_done)
+    return len(inserted)
+
+async def import_rows(engine: AsyncEngine, kind: str, rows: Iterable[dict], batch_size: int = 10000,
+                      checkpoint: Optional[Checkpoint] = None, hash_executor: Optional[ProcessPoolExecutor] = None,
+                      progress: Optional[Callable[[dict], None]] = None) -> dict:
+    # Passwords are hashed on hash_executor, or else on the event loop's
+    # default thread pool. A malformed row raises RowError; the batches before
+    # its own are already committed
+    checkpoint = checkpoint or Checkpoint(None, {})
+    async with engine.connect() as conn:
+        await checkpoint.load(conn)
+    rows = iter(rows)
+    # Skip the batches an earlier run already committed. Reading and parsing
+    # the input stays off the event loop
+    skipped = await run_in_threadpool(_skip, rows, checkpoint.batches_done * batch_size)
+    summary = {"kind": kind, "read": skipped, "inserted": 0, "skipped_rows": skipped, "batches": checkpoint.batches_done}
+
+    importer = IMPORTERS[kind](hash_executor)
+    started = time.perf_counter()
+    while True:
+        batch = await run_in_threadpool(_take, rows, batch_size)
+        if not batch:
+            break
+        summary["inserted"] += await _import_batch(engine, importer, batch, summary["read"] + 1,
+                                                   checkpoint, summary["batches"] + 1)
+        summary["read"] += len(batch)
+        summary["batches"] += 1
+        if progress:
+            elapsed = time.perf_counter() - started
+            progress({**summary, "rows_per_second": round((summary["read"] - skipped) / elapsed, 1) if elapsed else None})
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+from .config import settings
+
+class TTLCache:
+    # In-process LRU cache whose entries also expire after ttl seconds
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+class MemoryBackend:
+    # Per-process backend. With several workers each keeps its own copy, so a
+    # write on one worker is only seen by the others once their entries expire
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize, ttl)
+        self._counters = {}
+
+    async def get(self, key):
+        return self._cache.get(key)
+
+    async def set(self, key, value):
+        self._cache.set(key, value)
+
+    async def delete(self, key):
+        self._cache.pop(key)
+
+    async def incr(self, key) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def get_counter(self, key) -> int:
+        return self._counters.get(key, 0)
+
+class RedisBackend:
+    # Shared backend for any redis.asyncio-compatible client (redis.asyncio.Redis,
+    # fakeredis.aioredis.FakeRedis). Values are stored as JSON
+    def __init__(self, client, ttl: float):
+        self.client = client
+        self.ttl = ttl
+
+    async def get(self, key):
+        value = await self.client.get(key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key, value):
+        await self.client.set(key, json.dumps(value), ex=max(1, int(self.ttl)))
+
+    async def delete(self, key):
+        await self.client.delete(key)
+
+    async def incr(self, key) -> int:
+        return await self.client.incr(key)
+
+    async def get_counter(self, key) -> int:
+        value = await self.client.get(key)
+        return int(value) if value is not None else 0
+
+class ResponseCache:
+    # Read-through cache of JSON-ready response data. Single entries are
+    # invalidated by key; a namespace (e.g. every page of a listing) is
+    # invalidated by bumping its generation, which is part of its keys.
+    # Concurrent misses on the same key share one computation
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def _full_key(self, key: str, namespace: Optional[str]) -> str:
+        if namespace is None:
+            return key
+        generation = await self.backend.get_counter(f"{namespace}:generation")
+        return f"{namespace}:{generation}:{key}"
+
+    async def get_or_compute(self, key: str, compute, namespace: Optional[str] = None):
+        if self.backend is None:
+            return await compute()
+
+        full_key = await self._full_key(key, namespace)
+        value = await self.backend.get(full_key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(full_key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await compute()
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark the exception retrieved in case nobody was waiting on it
+            future.exception()
+            raise
+        finally:
+            # Dropped from _inflight by invalidate() if a write raced the computation
+            stale = self._inflight.pop(full_key, None) is not future
+        if not stale:
+            await self.backend.set(full_key, value)
+        future.set_result(value)
+        return value
+
+    async def invalidate(self, namespaces=(), keys=()):
+        if self.backend is None:
+            return
+        for namespace in namespaces:
+            await self.backend.incr(f"{namespace}:generation")
+        for key in keys:
+            self._inflight.pop(key, None)
+            await self.backend.delete(key)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+def create_backend(settings):
+    if settings.response_cache_backend == "memory":
+        return MemoryBackend(settings.response_cache_size, settings.response_cache_ttl_seconds)
+    if settings.response_cache_backend == "redis":
+        # Optional dependency, only needed for the shared backend
+        import redis.asyncio
+        return RedisBackend(redis.asyncio.from_url(settings.redis_url), settings.response_cache_ttl_seconds)
+    return None
+
+response_cache = ResponseCache(create_backend(settings))
+
+async def invalidate_posts(*post_ids: int):
+    # Called after a committed write that changes these posts or their votes
+    await response_cache.invalidate(namespaces=["posts", "hot"], keys=[f"post:{post_id}" for post_id in post_ids])
@@ -0,0 +1,91 @@
+"""Maintenance commands.
+
+    python -m app.commands repair-vote-counts
+    python -m app.commands rebuild-user-stats
+    python -m app.commands import users users.csv --hash-workers 8
+    python -m app.commands import votes votes.ndjson --format ndjson --checkpoint votes
+"""
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, bulk
+from .user_stats import rebuild_user_stats
+from .database import SessionLocal, engine
+
+async def repair_vote_counts(db: AsyncSession) -> int:
+    # Recompute posts.vote_count from the votes table, touching only drifted
+    # rows, then user_stats, whose votes_received drifted along with it
+    counts = select(models.Post.id.label("post_id"), func.count(models.Vote.post_id).label("votes")).join(
+        models.Vote, models.Vote.post_id == models.Post.id, isouter=True).group_by(models.Post.id).subquery()
+    result = await db.execute(
+        update(models.Post)
+        .where(models.Post.id == counts.c.post_id, models.Post.vote_count != counts.c.votes)
+        .values(vote_count=counts.c.votes)
+    )
+    await db.commit()
+    await rebuild_user_stats(db)
+    return result.rowcount
+
+async def _repair_vote_counts(args):
+    async with SessionLocal() as db:
+        repaired = await repair_vote_counts(db)
+        print(f"repaired vote_count on {repaired} posts and rebuilt user_stats")
+
+async def _rebuild_user_stats(args):
+    async with SessionLocal() as db:
+        rows = await rebuild_user_stats(db)
+        print(f"rebuilt user_stats for {rows} users")
+
+async def _import(args):
+    format = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    checkpoint = bulk.Checkpoint(args.checkpoint, {"kind": args.kind, "path": args.path, "batch_size": args.batch_size})
+    # Hashing is the slow part of a users import, so it is spread over processes
+    hash_executor = ProcessPoolExecutor(args.hash_workers or os.cpu_count()) if args.kind == "users" else None
+    try:
+        with open(args.path, newline="", encoding="utf-8") as f:
+            summary = await bulk.import_rows(
+                engine, args.kind, bulk.read_rows(f, format), batch_size=args.batch_size,
+                checkpoint=checkpoint, hash_executor=hash_executor,
+                progress=lambda state: print(json.dumps(state), flush=True))
+    except bulk.RowError as error:
+        raise SystemExit(f"{args.path}: {error}; the batches before it are imported")
+    finally:
+        if hash_executor:
+            hash_executor.shutdown()
+    print(json.dumps(summary))
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+COMMANDS = {
+    "repair-vote-counts": _repair_vote_counts,
+    "rebuild-user-stats": _rebuild_user_stats,
+    "import": _import,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("repair-vote-counts", help="recompute posts.vote_count and user_stats from votes")
+    subparsers.add_parser("rebuild-user-stats", help="recompute user_stats from posts and votes")
+
+    import_parser = subparsers.add_parser("import", help="bulk load users, posts or votes from CSV or NDJSON")
+    import_parser.add_argument("kind", choices=list(bulk.IMPORTERS))
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"], help="defaults to the file extension")
+    import_parser.add_argument("--batch-size", type=_positive_int, default=10000)
+    import_parser.add_argument("--checkpoint", help="name under which finished batches are recorded in the database, to resume an interrupted import")
+    import_parser.add_argument("--hash-workers", type=int, default=0, help="processes hashing passwords, defaults to the CPU count")
+
+    args = parser.parse_args()
+    asyncio.run(COMMANDS[args.command](args))
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 
 # Settings for the database
@@ -11,6 +12,106 @@ class Settings(BaseSettings):
     algorithm: str  
     access_token_expire_minutes: int
 
+    # Connection pool, see database.engine_options. db_pool_recycle=-1 never
+    # recycles; db_pgbouncer_mode disables prepared statement caching
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+    db_pgbouncer_mode: bool = False
+
+    # Optional read replicas as SQLAlchemy URLs (a JSON list in the environment).
+    # Read-only endpoints spread over the healthy ones, see database.ReplicaSet.
+    # A user's reads stay on the primary for db_read_your_writes_seconds after
+    # they write
+    db_replica_urls: List[str] = []
+    db_replica_check_interval_seconds: float = 5
+    db_read_your_writes_seconds: float = 5
+
+    # Password hashing pool: bcrypt runs off the event loop on this many
+    # workers, and at most hash_queue_size calls may wait for a free worker
+    hash_workers: int = 4
+    hash_queue_size: int = 32
+    hash_use_processes: bool = False
+
+    # Users resolved from access tokens are cached per process
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: float = 60
+
+    # Read-through cache for post reads: "memory" (per process), "redis" or "none"
+    response_cache_backend: str = "memory"
+    response_cache_size: int = 10000
+    response_cache_ttl_seconds: float = 30
+    redis_url: str = "redis://localhost:6379/0"
+
+    # Admission control: at most admission_max_in_flight requests are served at
+    # once (0 disables it) and admission_max_queue more wait up to
+    # admission_queue_timeout_seconds; the rest get a 503
+    admission_max_in_flight: int = 0
+    admission_max_queue: int = 100
+    admission_queue_timeout_seconds: float = 5
+    admission_retry_after_seconds: float = 1
+
+    # Token bucket limits per client (user, else address), keyed by
+    # "METHOD /route/template", as "count/second|minute|hour". The store is
+    # "memory" (per process) or "redis", shared through redis_url. Off by
+    # default, like admission: addresses are the peer's, so behind a proxy
+    # that is not trusted for X-Forwarded-For (see uvicorn's forwarded_allow_ips)
+    # every anonymous client shares one bucket. For example
+    # {"POST /login": "10/minute", "POST /users/": "5/minute"}
+    rate_limits: Dict[str, str] = {}
+    rate_limit_backend: str = "memory"
+
+    # Largest number of votes accepted by POST /vote/batch
+    vote_batch_max_size: int = 1000
+
+    # GET /posts/hot reads a ranking table that a background task rescores
+    # every hot_posts_refresh_seconds, see ranking.refresh_hot_posts
+    hot_posts_refresh_seconds: float = 60
+    hot_posts_gravity: float = 1.8
+    hot_posts_horizon_hours: float = 72
+    hot_posts_max_limit: int = 100
+
+    # Write-behind votes, see votes.VoteBuffer. When enabled POST /vote/ queues
+    # the vote and answers 202; a worker applies the queue in batches of
+    # vote_buffer_batch_size or every vote_buffer_flush_interval_seconds
+    vote_buffer_enabled: bool = False
+    vote_buffer_batch_size: int = 500
+    vote_buffer_flush_interval_seconds: float = 0.2
+    vote_buffer_max_pending: int = 50000
+
+    # Pool connections opened and warmed at startup, at most db_pool_size, before
+    # GET /ready reports ready; see warmup.warm_up. 0 skips the warmup
+    warmup_db_connections: int = 5
+
+    # Production server, see server.py: server_workers processes (0 = one per
+    # CPU), each restarted after about server_max_requests requests (0 never).
+    # With several workers the memory response cache is turned off and memory
+    # rate limits are refused; the redis backends (the redis extra, installed
+    # in the Docker image) are shared by all of them
+    # Every worker has its own database pool and hashing pool, so the
+    # database sees up to workers * (db_pool_size + db_max_overflow) connections
+    server_host: str = "0.0.0.0"
+    server_port: int = 80
+    server_workers: int = 0
+    server_max_requests: int = 10000
+    server_max_requests_jitter: int = 1000
+    server_graceful_timeout_seconds: int = 30
+    server_worker_timeout_seconds: int = 60
+    server_keepalive_seconds: int = 5
+    server_access_log: bool = False
+
+    # Largest page served by GET /posts/
+    posts_max_limit: int = 100
+
+    # Rows fetched per round trip by GET /posts/export
+    export_batch_size: int = 1000
+
+    # Key expected in the X-Admin-Key header of /admin routes, which are
+    # disabled while it is unset
+    admin_api_key: Optional[str] = None
+
     model_config = {"env_file": ".env"}
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -1,18 +1,166 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import asyncio
+import itertools
+import time
+from typing import List, Optional
+from uuid import uuid4
+from fastapi import Depends, Request
+from sqlalchemy import text
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from .config import settings
+from .cache import TTLCache
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
+SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # Queue pool that records how long checkouts wait for a free connection
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.max_checkout_wait_seconds = 0.0
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.checkout_wait_seconds += waited
+            self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds, waited)
+
+def engine_options(settings) -> dict:
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if settings.db_pgbouncer_mode:
+        # PgBouncer in transaction mode may hand each transaction a different
+        # server connection, so asyncpg must not rely on named prepared statements
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return options
+
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, **engine_options(settings))
+
+# expire_on_commit=False keeps loaded attributes usable after commit, since an
+# AsyncSession cannot lazily reload them when the response is serialized
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+class ReplicaSet:
+    # Read replicas, used round-robin while healthy. Reads fall back to the
+    # primary when no replica is healthy, and for a user who wrote within the
+    # last sticky_seconds, so they see their own writes despite replication lag
+    def __init__(self, urls: List[str], sticky_seconds: float, options: dict):
+        self.engines = [create_async_engine(url, **options) for url in urls]
+        self.sessionmakers = [
+            async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+            for engine in self.engines
+        ]
+        self.healthy = [True] * len(self.engines)
+        self.recent_writers = TTLCache(100000, sticky_seconds)
+        self._next = itertools.count()
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    def choose(self, user_id: Optional[int] = None) -> Optional[int]:
+        # Index of the replica to read from, or None for the primary
+        if user_id is not None and self.recent_writers.get(user_id):
+            self.sticky_reads += 1
+            return None
+        healthy = [i for i, up in enumerate(self.healthy) if up]
+        if not healthy:
+            self.primary_reads += 1
+            return None
+        self.replica_reads += 1
+        return healthy[next(self._next) % len(healthy)]
+
+    def mark_write(self, user_id: int):
+        if self.engines:
+            self.recent_writers.set(user_id, True)
+
+    async def check(self, timeout: float = 2):
+        async def ping(engine):
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        for i, engine in enumerate(self.engines):
+            try:
+                await asyncio.wait_for(ping(engine), timeout)
+                self.healthy[i] = True
+            except (OSError, asyncio.TimeoutError, InterfaceError, OperationalError):
+                self.healthy[i] = False
+
+    async def run_health_checks(self, interval: float):
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+    async def dispose(self):
+        for engine in self.engines:
+            await engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.engines),
+            "healthy_replicas": sum(self.healthy),
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "sticky_reads": self.sticky_reads,
+        }
+
+replicas = ReplicaSet(settings.db_replica_urls, settings.db_read_your_writes_seconds, engine_options(settings))
+
+async def get_read_db(request: Request, primary: AsyncSession = Depends(get_db)):
+    # Session for read-only endpoints. The primary session is only connected
+    # when it is used, so depending on it costs nothing on the replica path
+    index = replicas.choose(getattr(request.state, "user_id", None))
+    if index is None:
+        yield primary
+        return
+    async with replicas.sessionmakers[index]() as db:
+        try:
+            yield db
+        except (OSError, InterfaceError, OperationalError):
+            # Leave the replica out until the next health check finds it up
+            replicas.healthy[index] = False
+            raise
+
+def pool_stats(engine=engine) -> dict:
+    pool = engine.pool
+    stats = {
+        "pool_size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            "checkouts": pool.checkouts,
+            "checkout_timeouts": pool.checkout_timeouts,
+            "avg_checkout_wait_ms": round(pool.checkout_wait_seconds / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            "max_checkout_wait_ms": round(pool.max_checkout_wait_seconds * 1000, 3),
+        })
+    return stats
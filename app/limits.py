@@ -0,0 +1,213 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Optional
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+from .config import settings
+from .cache import TTLCache
+
+# Overload protection. AdmissionController caps the requests being served at
+# once, queues a bounded number more and sheds the rest with a 503, so a spike
+# cannot take every database connection. Token buckets limit each client on
+# the routes listed in settings.rate_limits
+
+# Always admitted, so the server can be observed and probed while it sheds load
+EXEMPT_PATHS = ("/metrics", "/stats/", "/ready")
+
+def _busy(retry_after: float) -> JSONResponse:
+    return JSONResponse({"detail": "Server is busy, try again later"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        headers={"Retry-After": str(math.ceil(retry_after))})
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # release() may already have popped the waiter, and on Python 3.12+
+            # it may even have handed it the slot as the wait timed out; that
+            # slot is passed on rather than lost
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                self.release()
+            self.timed_out += 1
+            return False
+        except asyncio.CancelledError:
+            # The client went away while queued
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        self.admitted += 1
+        return True
+
+    def release(self):
+        # A freed slot goes straight to the oldest waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.max_in_flight > 0,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+admission = AdmissionController(settings.admission_max_in_flight, settings.admission_max_queue,
+                                settings.admission_queue_timeout_seconds)
+
+async def admit(request: Request, call_next):
+    if admission.max_in_flight <= 0 or request.url.path in EXEMPT_PATHS:
+        return await call_next(request)
+    if not await admission.acquire():
+        return _busy(settings.admission_retry_after_seconds)
+    try:
+        return await call_next(request)
+    finally:
+        admission.release()
+
+# -- Rate limits --
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+def parse_rate(rate: str):
+    # "10/minute" -> bucket of 10 tokens refilled at 10 per 60 seconds
+    count, _, period = rate.partition("/")
+    return int(count), int(count) / _PERIODS[period.strip()]
+
+class MemoryRateLimitStore:
+    # Per-process buckets. With several workers each client gets the limit on
+    # every worker; use the Redis store to share them
+    def __init__(self, maxsize: int = 100000):
+        self._buckets = TTLCache(maxsize, 3600)
+
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> float:
+        # Takes a token; returns 0 if one was available, else seconds until one is
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+        if tokens < 1:
+            self._buckets.set(key, (tokens, now))
+            return (1 - tokens) / refill_per_second
+        self._buckets.set(key, (tokens - 1, now))
+        return 0.0
+
+    def clear(self):
+        self._buckets.clear()
+
+# Refill and take in one atomic step on the Redis server
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+else
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+class RedisRateLimitStore:
+    # Buckets shared by every worker, for any redis.asyncio-compatible client
+    def __init__(self, client):
+        self.client = client
+
+    async def take(self, key: str, capacity: int, refill_per_second: float) -> float:
+        wait = await self.client.eval(_TAKE_SCRIPT, 1, f"ratelimit:{key}", capacity, refill_per_second, time.time())
+        return float(wait)
+
+    def clear(self):
+        pass
+
+def create_store(settings):
+    if settings.rate_limit_backend == "redis":
+        # Optional dependency, only needed for the shared store
+        import redis.asyncio
+        return RedisRateLimitStore(redis.asyncio.from_url(settings.redis_url))
+    return MemoryRateLimitStore()
+
+class RateLimiter:
+    def __init__(self, rates: dict, store):
+        # rates: {"METHOD /route/template": "count/period"}
+        self.rates = {route: parse_rate(rate) for route, rate in rates.items()}
+        self.store = store
+        self.allowed = 0
+        self.limited = 0
+
+    def stats(self) -> dict:
+        return {
+            "routes": len(self.rates),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+rate_limiter = RateLimiter(settings.rate_limits, create_store(settings))
+
+def _client_key(request: Request) -> str:
+    # Authenticated clients are limited per user, the rest per address
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            user_id = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm]).get("user_id")
+            if user_id is not None:
+                return f"user:{user_id}"
+        except JWTError:
+            pass
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+async def rate_limit(request: Request):
+    # App-wide dependency, so it runs after routing and sees the route template
+    route = f"{request.method} {getattr(request.scope.get('route'), 'path', '')}"
+    rate: Optional[tuple] = rate_limiter.rates.get(route)
+    if rate is None:
+        return
+    wait = await rate_limiter.store.take(f"{route}:{_client_key(request)}", *rate)
+    if wait > 0:
+        rate_limiter.limited += 1
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests",
+                            headers={"Retry-After": str(math.ceil(wait))})
+    rate_limiter.allowed += 1
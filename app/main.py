@@ -1,25 +1,85 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import post, user, auth, vote
+from fastapi.responses import JSONResponse
+from .routers import post, user, auth, vote, stats, admin
+from .database import engine, replicas
+from .config import settings
+from . import limits, metrics, oauth2, ranking, utils, warmup
+from .votes import vote_buffer
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Requests are only served once this returns, so they never find a cold
+    # pool or uncompiled statements
+    await warmup.warm_up(settings.warmup_db_connections)
+    # Background tasks live as long as the app
+    tasks = [asyncio.create_task(ranking.run_refresh(settings.hot_posts_refresh_seconds))]
+    if replicas.engines:
+        tasks.append(asyncio.create_task(replicas.run_health_checks(settings.db_replica_check_interval_seconds)))
+    if settings.vote_buffer_enabled:
+        tasks.append(asyncio.create_task(vote_buffer.run()))
+    yield
+    # Fail readiness first, so the load balancer stops routing here
+    warmup.ready = False
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Votes already acknowledged must not be lost
+    await vote_buffer.flush()
+    await replicas.dispose()
+    # With hash_use_processes its worker processes would outlive this one
+    utils.hasher.shutdown()
 
-origins = ["*"]
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan, dependencies=[Depends(limits.rate_limit)])
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    # -- Overload protection --
+    app.middleware("http")(limits.admit)
 
-# -- Routers --
-app.include_router(post.router)
-app.include_router(user.router)
-app.include_router(auth.router)
-app.include_router(vote.router)
+    # -- Instrumentation --
+    metrics.instrument_engine(engine.sync_engine)
+    app.middleware("http")(metrics.instrument)
 
-@app.get("/")
-async def root():
-    return {"message": "Welcome to my API"}
+    # -- Read replicas --
+    # Only needed to route reads, so apps without replicas skip the hop
+    if replicas.engines:
+        app.middleware("http")(oauth2.track_writers)
+
+    # -- CORS --
+    # Added last, so it is the outermost middleware and the responses the
+    # others produce themselves, e.g. a load-shed 503, carry its headers too
+    origins = ["*"]
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Server-Timing", "ETag", "Last-Modified"],
+    )
+
+    # -- Routers --
+    app.include_router(post.router)
+    app.include_router(user.router)
+    app.include_router(auth.router)
+    app.include_router(vote.router)
+    app.include_router(stats.router)
+    app.include_router(admin.router)
+
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to my API"}
+
+    @app.get("/ready")
+    async def ready():
+        # Readiness probe: 503 until the warmup has run and again while shutting down
+        if not warmup.ready:
+            return JSONResponse({"status": "starting"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return {"status": "ready"}
+
+    return app
+
+app = create_app()
@@ -0,0 +1,139 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Request latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+class RequestStats:
+    # Mutable per-request counters. The middleware puts one in a contextvar
+    # and the engine events add to it from wherever the query runs
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+request_latency = {}   # (method, route) -> Histogram
+request_db_seconds = {}   # (method, route) -> Histogram
+request_statements = {}   # (method, route) -> total statements
+request_counts = {}   # (method, route, status) -> count
+in_flight = 0
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = current_request.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+def instrument_engine(engine: Engine):
+    # Takes the sync engine, i.e. async_engine.sync_engine
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+def _route_label(request: Request) -> str:
+    # The path template keeps label cardinality bounded (/posts/{id}, not /posts/42)
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+async def instrument(request: Request, call_next):
+    global in_flight
+    stats = RequestStats()
+    token = current_request.set(stats)
+    in_flight += 1
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        in_flight -= 1
+        current_request.reset(token)
+
+        key = (request.method, _route_label(request))
+        request_latency.setdefault(key, Histogram()).observe(elapsed)
+        request_db_seconds.setdefault(key, Histogram()).observe(stats.db_seconds)
+        request_statements[key] = request_statements.get(key, 0) + stats.statements
+        count_key = (*key, str(status_code))
+        request_counts[count_key] = request_counts.get(count_key, 0) + 1
+
+    response.headers["Server-Timing"] = (
+        f'app;dur={elapsed * 1000:.2f}, '
+        f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.statements} queries"'
+    )
+    return response
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+def _write_histogram(lines, name, help, histograms):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route), histogram in sorted(histograms.items()):
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, le=bound)} {count}")
+        lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(method=method, route=route)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(method=method, route=route)} {histogram.count}")
+
+def render(gauges: dict) -> str:
+    # Prometheus text exposition format. gauges is {section: {name: value}},
+    # e.g. the sections of GET /stats/, exported as <section>_<name>
+    lines = []
+    _write_histogram(lines, "http_request_duration_seconds", "Request latency by route.", request_latency)
+    _write_histogram(lines, "http_request_db_duration_seconds", "Time spent in SQL per request by route.", request_db_seconds)
+
+    lines.append("# HELP http_request_db_statements_total SQL statements executed by route.")
+    lines.append("# TYPE http_request_db_statements_total counter")
+    for (method, route), count in sorted(request_statements.items()):
+        lines.append(f"http_request_db_statements_total{_labels(method=method, route=route)} {count}")
+
+    lines.append("# HELP http_requests_total Requests by route and status.")
+    lines.append("# TYPE http_requests_total counter")
+    for (method, route, status), count in sorted(request_counts.items()):
+        lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+    lines.append("# HELP http_requests_in_flight Requests currently being served.")
+    lines.append("# TYPE http_requests_in_flight gauge")
+    lines.append(f"http_requests_in_flight {in_flight}")
+
+    for section, values in gauges.items():
+        for name, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f"# TYPE {section}_{name} gauge")
+            lines.append(f"{section}_{name} {value}")
+
+    return "\n".join(lines) + "\n"
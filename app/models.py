@@ -1,7 +1,7 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, Float, TIMESTAMP, ForeignKey, Index, func, literal_column
 from sqlalchemy.sql.expression import text
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, synonym
 
 class User(Base):
     __tablename__ = "users"
@@ -13,6 +13,15 @@ class User(Base):
 
     posts = relationship("Post", back_populates="owner")
     
+# title || ' ' || content, spelled the way Postgres reports it back in index
+# definitions, so autogenerate sees the indexes the migration created as unchanged
+_SEARCH_DOCUMENT = "(title::text || ' '::text) || content::text"
+
+def _has_pg_trgm(ddl, target, bind, **kw):
+    # create_all builds the trigram index only where pg_trgm is installed. The
+    # add_posts_search_indexes migration installs it
+    return bind.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar() is not None
+
 class Post(Base):
     __tablename__ = "posts"
     
@@ -21,16 +30,72 @@ class Post(Base):
     content = Column(String, nullable=False)
     published = Column(Boolean, server_default='TRUE', nullable=False)
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    # Denormalized count of rows in votes for this post, maintained by the vote router
+    vote_count = Column(Integer, server_default='0', nullable=False)
+    # The name the API schemas use, so PostWithVotes validates straight from a Post
+    votes = synonym("vote_count")
+    # Bumped by every UPDATE of the row, votes included. The version marker of
+    # the post's ETag and Last-Modified
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'), onupdate=text('now()'))
 
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
     owner = relationship("User", back_populates="posts")
 
+    __table_args__ = (
+        # Serves the (created_at, id) keyset ordering of GET /posts
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        # Foreign key lookups, e.g. the cascade when a user is deleted
+        Index("ix_posts_owner_id", "owner_id"),
+        # Search over (title || ' ' || content), the document routers/post.py
+        # searches: full-text, and substring matches through pg_trgm
+        Index("ix_posts_search_fulltext", func.to_tsvector(literal_column("'english'::regconfig"), literal_column(_SEARCH_DOCUMENT)),
+              postgresql_using="gin"),
+        Index("ix_posts_search_trigram", literal_column(f"({_SEARCH_DOCUMENT})").label("document"),
+              postgresql_using="gin", postgresql_ops={"document": "gin_trgm_ops"}).ddl_if(callable_=_has_pg_trgm),
+    )
+
 class Vote(Base):
     __tablename__ = "votes"
 
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
 
+    __table_args__ = (
+        # The primary key leads with user_id, so lookups by post need their own
+        # index: deleting a post, recounting its votes
+        Index("ix_votes_post_id", "post_id"),
+    )
+
+class PostRanking(Base):
+    # Precomputed hot feed scores, rewritten by ranking.refresh_hot_posts
+    __tablename__ = "post_rankings"
+
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # GET /posts/hot reads the top of this index and stops
+        Index("ix_post_rankings_score_post_id", "score", "post_id"),
+    )
+
+class UserStats(Base):
+    # Per-user aggregates for GET /users/{id}/stats, kept up to date by the post
+    # and vote writes (see user_stats.py) and rebuilt by
+    # `python -m app.commands rebuild-user-stats`
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    post_count = Column(Integer, server_default='0', nullable=False)
+    votes_received = Column(Integer, server_default='0', nullable=False)
+    last_post_at = Column(TIMESTAMP(timezone=True))
 
+class ImportCheckpoint(Base):
+    # Finished batches of a resumable bulk import, see bulk.Checkpoint. key
+    # identifies the input, so a new input under the same name starts over
+    __tablename__ = "import_checkpoints"
 
+    name = Column(String, primary_key=True)
+    key = Column(String, nullable=False)
+    batches_done = Column(Integer, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=text('now()'), nullable=False)
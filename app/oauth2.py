@@ -1,12 +1,13 @@
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from .schemes import TokenData
-from fastapi import Depends, HTTPException, status
+from .schemes import TokenData, UserOut
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from .database import get_db
-from . import models
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_read_db
+from . import database, models
 from .config import settings
+from .cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
@@ -14,6 +15,14 @@ SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
+# Resolved users keyed by id, so authenticated requests skip the users lookup
+user_cache = TTLCache(settings.user_cache_size, settings.user_cache_ttl_seconds)
+
+def invalidate_user(user_id: int):
+    # Users are written with Core statements, which fire no ORM events, so
+    # every write to users calls this itself
+    user_cache.pop(user_id)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
 
@@ -39,7 +48,7 @@ def verify_access_token(token: str, credentials_exception):
     except JWTError:
         raise credentials_exception
         
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -47,9 +56,37 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     )
 
     token = verify_access_token(token, credentials_exception)
-    
-    user = db.query(models.User).filter(models.User.id == token.id).first()
+
+    user = user_cache.get(token.id)
+    if user is None:
+        user = await db.get(models.User, token.id)
+        if user is not None:
+            user = UserOut.model_validate(user)
+            user_cache.set(user.id, user)
 
     return user
-    
-    
+
+async def warm_up(db: AsyncSession):
+    # The token check and user lookup of every authenticated request, see warmup.warm_up
+    verify_access_token(create_access_token({"user_id": 0}), HTTPException(status_code=status.HTTP_401_UNAUTHORIZED))
+    await db.get(models.User, 0)
+
+# Methods that never write
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+async def track_writers(request: Request, call_next):
+    # Read-your-writes for replica reads: notes who is calling, for
+    # database.get_read_db, and keeps a user on the primary right after they
+    # write. Installed by create_app() only when replicas are configured
+    user_id = None
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            user_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("user_id")
+        except JWTError:
+            pass
+    request.state.user_id = user_id
+    response = await call_next(request)
+    if user_id is not None and request.method not in SAFE_METHODS and response.status_code < 400:
+        database.replicas.mark_write(user_id)
+    return response
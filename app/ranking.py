@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from .config import settings
+from .database import engine
+from .cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Hot feed scores: votes / (age_hours + 2) ** gravity, so a post's score decays
+# as it ages. Only posts inside the horizon are rescored; older ones drop out
+# of post_rankings, so a refresh costs the same however large votes grows
+_REFRESH = text("""
+    WITH scored AS (
+        INSERT INTO post_rankings (post_id, score)
+        SELECT id, vote_count / power(extract(epoch FROM now() - created_at)::float8 / 3600 + 2, CAST(:gravity AS float8))
+        FROM posts
+        WHERE created_at > now() - make_interval(secs => CAST(:horizon_hours AS float8) * 3600)
+        ON CONFLICT (post_id) DO UPDATE SET score = excluded.score
+        RETURNING post_id
+    )
+    DELETE FROM post_rankings r
+    WHERE NOT EXISTS (SELECT 1 FROM scored WHERE scored.post_id = r.post_id)
+""")
+
+# Every worker, and every server, runs run_refresh against the same database;
+# only the process holding this session-level advisory lock refreshes. The
+# lock goes with the connection that took it, so when the holder exits
+# another process takes over within an interval
+_TRY_REFRESH_LOCK = text("SELECT pg_try_advisory_lock(hashtext('post_rankings'))")
+
+refreshes = 0
+last_refresh_seconds = 0.0
+refreshing = False
+
+async def refresh_hot_posts(db: AsyncSession):
+    global refreshes, last_refresh_seconds
+    start = time.perf_counter()
+    await db.execute(_REFRESH, {"gravity": settings.hot_posts_gravity, "horizon_hours": settings.hot_posts_horizon_hours})
+    await db.commit()
+    await response_cache.invalidate(namespaces=["hot"])
+    refreshes += 1
+    last_refresh_seconds = time.perf_counter() - start
+
+async def take_refresh_lock(conn: AsyncConnection) -> bool:
+    locked = await conn.scalar(_TRY_REFRESH_LOCK)
+    # The lock outlives the transaction, which must not be left open
+    await conn.commit()
+    return locked
+
+async def _release(conn: AsyncConnection):
+    # Closing the database connection, rather than returning it to the pool,
+    # drops the lock
+    await conn.invalidate()
+    await conn.close()
+
+async def run_refresh(interval: float):
+    global refreshing
+    holder = None
+    try:
+        while True:
+            try:
+                if holder is None:
+                    conn, locked = await engine.connect(), False
+                    try:
+                        locked = await take_refresh_lock(conn)
+                    finally:
+                        if locked:
+                            holder = conn
+                        else:
+                            await conn.close()
+                refreshing = holder is not None
+                if holder is not None:
+                    async with AsyncSession(bind=holder, expire_on_commit=False) as db:
+                        await refresh_hot_posts(db)
+            except Exception:
+                logger.exception("hot posts refresh failed")
+                # The lock may have gone with a broken connection; take it again
+                if holder is not None:
+                    await _release(holder)
+                    holder = None
+            await asyncio.sleep(interval)
+    finally:
+        refreshing = False
+        if holder is not None:
+            await _release(holder)
+
+def stats() -> dict:
+    return {
+        "refreshing": refreshing,
+        "refreshes": refreshes,
+        "last_refresh_ms": round(last_refresh_seconds * 1000, 3),
+    }
@@ -0,0 +1,36 @@
+import io
+import secrets
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, UploadFile, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import bulk
+from ..cache import invalidate_posts
+from ..config import settings
+from ..database import get_db
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"]
+)
+
+def require_admin(x_admin_key: Optional[str] = Header(default=None)):
+    # Admin routes are off unless admin_api_key is configured
+    if not settings.admin_api_key or not x_admin_key or not secrets.compare_digest(x_admin_key, settings.admin_api_key):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                          detail="Not authorized to perform requested action")
+
+@router.post("/import/{kind}", dependencies=[Depends(require_admin)])
+async def bulk_import(kind: Literal["users", "posts", "votes"], file: UploadFile = File(...), format: Optional[Literal["csv", "ndjson"]] = None, batch_size: int = Query(10000, ge=1), db: AsyncSession = Depends(get_db)):
+    format = format or ("ndjson" if (file.filename or "").endswith((".ndjson", ".jsonl")) else "csv")
+    lines = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    # Reading, parsing and hashing run in threads, not on the event loop
+    done = {}
+    try:
+        return await bulk.import_rows(db.bind, kind, bulk.read_rows(lines, format), batch_size=batch_size,
+                                      progress=done.update)
+    except bulk.RowError as error:
+        # The batches before the failing row's are committed
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail={"row": error.row, "error": error.message, "committed_rows": done.get("read", 0)})
+    finally:
+        await invalidate_posts()
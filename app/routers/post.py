@@ -1,77 +1,273 @@
-from fastapi import Depends, HTTPException, status, APIRouter, Response
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import Optional, List
-from .. import models, oauth2
+import base64
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from fastapi import Depends, HTTPException, status, APIRouter, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import delete, func, insert, literal_column, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import Literal, Optional, List
+from pydantic import TypeAdapter
+from .. import conditional, models, oauth2, user_stats
 from ..schemes import Post, PostCreate, PostWithVotes
-from ..database import get_db
+from ..database import get_db, get_read_db
+from ..config import settings
+from ..cache import response_cache, invalidate_posts
 
 router = APIRouter(
     prefix="/posts",
-    tags=['Posts']
+    tags=['Posts'],
+    default_response_class=ORJSONResponse
 )
 
+# Owners are joined into the same SELECT, so a page costs one statement however
+# many distinct owners it has. Vote totals come from the denormalized posts.vote_count
+_with_owner = joinedload(models.Post.owner, innerjoin=True)
+
+def _posts_with_votes():
+    return select(models.Post).options(_with_owner)
+
+# Searchable text of a post. It must stay identical to the expression the
+# search indexes are built on (see models.Post and the add_posts_search_indexes migration)
+_search_document = models.Post.title + literal_column("' '") + models.Post.content
+_search_vector = func.to_tsvector(literal_column("'english'"), _search_document)
+
+def _search_posts(query, search: Optional[str], search_mode: str):
+    # Applies the search filter and listing order shared by GET /posts and the export.
+    # An empty search adds no predicate
+    if search and search_mode == "fulltext":
+        # Full-text search over the GIN tsvector index, best matches first
+        ts_query = func.websearch_to_tsquery(literal_column("'english'"), search)
+        return query.filter(_search_vector.op("@@")(ts_query)).order_by(
+            func.ts_rank(_search_vector, ts_query).desc(), models.Post.id.desc())
+    if search:
+        # Substring match served by the pg_trgm index
+        query = query.filter(_search_document.contains(search))
+    return query.order_by(models.Post.created_at.desc(), models.Post.id.desc())
+
+# Posts are listed newest first. The cursor is an opaque encoding of the
+# (created_at, id) of the last post on a page
+def _encode_cursor(post) -> str:
+    raw = json.dumps([post.created_at.isoformat(), post.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                          detail="Invalid cursor")
+
+# Post reads are cached as the JSON text of their response. It is built by
+# pydantic's compiled validator and serializer straight from the ORM objects,
+# and sent as is, without FastAPI validating and encoding it again
+_post_list = TypeAdapter(List[PostWithVotes])
+
+def _format_posts(posts) -> str:
+    return _post_list.dump_json(_post_list.validate_python(posts, from_attributes=True)).decode()
+
+def _format_post(post) -> str:
+    return PostWithVotes.model_validate(post).model_dump_json()
+
+def _json_response(body: str, headers: Optional[dict] = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _version(rows):
+    # ETag and Last-Modified of a response holding these (id, updated_at) rows
+    return (conditional.make_etag(*((id, updated_at.isoformat()) for id, updated_at in rows)),
+            max((updated_at for _, updated_at in rows), default=None))
+
+def _page_etag(rows):
+    # Pages of GET /posts/ have an ETag and no Last-Modified: a page changes
+    # without any row on it being updated when a delete pulls in an older
+    # post or an insert shifts every skip page
+    return _version(rows)[0]
+
+def _cached_validators(entry) -> dict:
+    last_modified = entry["last_modified"] and datetime.fromisoformat(entry["last_modified"])
+    return conditional.validators(entry["etag"], last_modified)
+
+def _page_query(limit: int, skip: int, search: Optional[str], search_mode: str, after=None):
+    query = _search_posts(select(models.Post), search, search_mode)
+    if after:
+        # Keyset pagination: seek past the previous page through the index
+        query = query.filter(tuple_(models.Post.created_at, models.Post.id) < tuple_(*after))
+    else:
+        query = query.offset(skip)
+    # One extra row tells us whether there is a next page
+    return query.limit(limit + 1)
+
+def _hot_query(limit: int):
+    # Only the top of the precomputed ranking is read, never the votes
+    return _posts_with_votes().join(models.PostRanking, models.PostRanking.post_id == models.Post.id).order_by(
+        models.PostRanking.score.desc(), models.PostRanking.post_id.desc()).limit(limit)
+
 @router.get("/", response_model=List[PostWithVotes])
-def get_posts(db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user), limit: int = 10, skip: int = 0, search: Optional[str] = ""):
-    results = db.query(models.Post, func.count(models.Vote.post_id).label("votes")).join(
-        models.Vote, models.Vote.post_id == models.Post.id, isouter=True).group_by(models.Post.id).filter(models.Post.title.contains(search)).limit(limit).offset(skip).all()
-    
-    formatted_results = [
-        {
-            **post.__dict__,
-            "votes": votes,
-            "owner": post.owner
-        } for post, votes in results
-    ]
-    return formatted_results
+async def get_posts(request: Request, db: AsyncSession = Depends(get_read_db), current_user: int = Depends(oauth2.get_current_user), limit: int = Query(10, ge=1, le=settings.posts_max_limit), skip: int = Query(0, ge=0), search: Optional[str] = "", search_mode: Literal["substring", "fulltext"] = "substring", cursor: Optional[str] = None):
+    ranked = bool(search) and search_mode == "fulltext"
+    if ranked and cursor:
+        # Rank order has no stable keyset, so only offset pagination applies
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                          detail="cursor pagination is not supported for fulltext search")
+    query = _page_query(limit, skip, search, search_mode, _decode_cursor(cursor) if cursor else None)
+
+    if "if-none-match" in request.headers:
+        # The page's version comes from its ids and updated_at alone
+        etag = _page_etag((await db.execute(query.with_only_columns(models.Post.id, models.Post.updated_at))).all())
+        if conditional.not_modified(request, etag, None):
+            return conditional.not_modified_response(etag, None)
+
+    async def load_page():
+        results = (await db.execute(query.options(_with_owner))).scalars().all()
+        etag = _page_etag([(post.id, post.updated_at) for post in results])
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            if not ranked:
+                next_cursor = _encode_cursor(results[-1])
+        return {"posts": _format_posts(results), "next_cursor": next_cursor,
+                "etag": etag, "last_modified": None}
+
+    cache_key = json.dumps([limit, skip, search, search_mode, cursor])
+    page = await response_cache.get_or_compute(cache_key, load_page, namespace="posts")
+    headers = _cached_validators(page)
+    if page["next_cursor"]:
+        headers["X-Next-Cursor"] = page["next_cursor"]
+    return _json_response(page["posts"], headers)
+
+@router.get("/hot", response_model=List[PostWithVotes])
+async def get_hot_posts(db: AsyncSession = Depends(get_read_db), current_user: int = Depends(oauth2.get_current_user), limit: int = Query(10, ge=1, le=settings.hot_posts_max_limit)):
+    async def load_hot():
+        return _format_posts((await db.execute(_hot_query(limit))).scalars().all())
+
+    return _json_response(await response_cache.get_or_compute(str(limit), load_hot, namespace="hot"))
+
+_EXPORT_COLUMNS = ["id", "title", "content", "published", "created_at", "owner_id", "owner_email", "votes"]
+
+def _export_query(search: Optional[str], search_mode: str):
+    # Flat rows straight from the tables, no ORM objects to build per row
+    query = select(
+        models.Post.id, models.Post.title, models.Post.content, models.Post.published, models.Post.created_at,
+        models.Post.owner_id, models.User.email.label("owner_email"), models.Post.vote_count.label("votes"),
+    ).join(models.User, models.User.id == models.Post.owner_id)
+    return _search_posts(query, search, search_mode)
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _format_ndjson(rows) -> str:
+    return "".join(json.dumps({column: _export_value(value) for column, value in zip(_EXPORT_COLUMNS, row)}) + "\n" for row in rows)
+
+def _format_csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_export_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+@router.get("/export")
+async def export_posts(db: AsyncSession = Depends(get_read_db), current_user: int = Depends(oauth2.get_current_user), format: Literal["ndjson", "csv"] = "ndjson", search: Optional[str] = "", search_mode: Literal["substring", "fulltext"] = "substring"):
+    query = _export_query(search, search_mode).execution_options(yield_per=settings.export_batch_size)
+    # The request session is closed before the body is sent, so the stream
+    # opens its own connection on the same engine
+    bind = db.bind
+    formatter = _format_ndjson if format == "ndjson" else _format_csv
+
+    async def stream():
+        if format == "csv":
+            yield _format_csv([_EXPORT_COLUMNS])
+        async with bind.connect() as conn:
+            # A server-side cursor, so memory holds one batch whatever the table size
+            result = await conn.stream(query)
+            async for rows in result.partitions():
+                yield formatter(rows)
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    headers = {"Content-Disposition": f'attachment; filename="posts.{format}"'}
+    return StreamingResponse(stream(), media_type=media_type, headers=headers)
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=Post)
-def create_posts(post: PostCreate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    new_post = models.Post(owner_id=current_user.id, **post.model_dump())
-    db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
-    return new_post
+async def create_posts(post: PostCreate, db: AsyncSession = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    # The owner's user_stats row is counted in the same statement
+    inserted = insert(models.Post).values(owner_id=current_user.id, **post.model_dump()).returning(*models.Post.__table__.c).cte("inserted")
+    new_post = (await db.execute(select(inserted).add_cte(user_stats.count_new_posts(inserted).cte("stats")))).one()
+    await db.commit()
+    await invalidate_posts()
+    # The owner is the current user, so the response needs no extra lookup
+    return {**new_post._mapping, "owner": current_user}
 
 @router.get("/{id}", response_model=PostWithVotes)
-def get_post(id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    result = db.query(models.Post, func.count(models.Vote.post_id).label("votes")).join(
-        models.Vote, models.Vote.post_id == models.Post.id, isouter=True).group_by(models.Post.id).filter(models.Post.id == id).first()
-    
-    if not result:
+async def get_post(id: int, request: Request, db: AsyncSession = Depends(get_read_db), current_user: int = Depends(oauth2.get_current_user)):
+    if conditional.is_conditional(request):
+        updated_at = await db.scalar(select(models.Post.updated_at).where(models.Post.id == id))
+        if updated_at is not None:
+            etag, last_modified = _version([(id, updated_at)])
+            if conditional.not_modified(request, etag, last_modified):
+                return conditional.not_modified_response(etag, last_modified)
+
+    async def load_post():
+        post = (await db.execute(_posts_with_votes().filter(models.Post.id == id))).scalars().first()
+        if not post:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                              detail=f"post with id: {id} was not found")
+        etag, last_modified = _version([(post.id, post.updated_at)])
+        return {"post": _format_post(post), "etag": etag, "last_modified": last_modified.isoformat()}
+
+    entry = await response_cache.get_or_compute(f"post:{id}", load_post)
+    return _json_response(entry["post"], _cached_validators(entry))
+
+async def _missing_or_forbidden(db: AsyncSession, id: int):
+    # Only reached when an ownership-checked write matched no row
+    if await db.scalar(select(models.Post.id).where(models.Post.id == id)) is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                           detail=f"post with id: {id} was not found")
-    
-    post, votes = result
-    formatted_result = {
-        **post.__dict__,
-        "votes": votes,
-        "owner": post.owner
-    }
-    return formatted_result
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                      detail="Not authorized to perform requested action")
+
+def _delete_statement(id: int, owner_id: int):
+    deleted = delete(models.Post).where(models.Post.id == id, models.Post.owner_id == owner_id).returning(
+        models.Post.id, models.Post.owner_id, models.Post.vote_count).cte("deleted")
+    return select(deleted.c.id).add_cte(user_stats.uncount_deleted_post(deleted).cte("stats"))
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_post(id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    query = db.query(models.Post).filter(models.Post.id == id)
-    if not query.first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                          detail=f"post with id: {id} was not found")
-    if query.first().owner_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                          detail="Not authorized to perform requested action")
-    query.delete(synchronize_session=False)
-    db.commit()
+async def delete_post(id: int, db: AsyncSession = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    deleted = await db.scalar(_delete_statement(id, current_user.id))
+    if deleted is None:
+        await _missing_or_forbidden(db, id)
+    await db.commit()
+    await invalidate_posts(id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.put("/{id}", response_model=Post)
-def update_post(id: int, post: PostCreate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    query = db.query(models.Post).filter(models.Post.id == id)
-    if not query.first():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                          detail=f"post with id: {id} was not found")
-    if query.first().owner_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                          detail="Not authorized to perform requested action")
-    query.update(post.model_dump(), synchronize_session=False)
-    db.commit()
-    return query.first()
\ No newline at end of file
+async def update_post(id: int, post: PostCreate, db: AsyncSession = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    updated_post = (await db.execute(
+        update(models.Post).where(models.Post.id == id, models.Post.owner_id == current_user.id)
+        .values(**post.model_dump()).returning(*models.Post.__table__.c))).first()
+    if updated_post is None:
+        await _missing_or_forbidden(db, id)
+    await db.commit()
+    await invalidate_posts(id)
+    return {**updated_post._mapping, "owner": current_user}
+
+# -- Warmup, see warmup.warm_up --
+
+async def warm_up(db: AsyncSession):
+    # The hot post statements, with values that match no row where they write
+    page = _page_query(10, 0, "", "substring")
+    await db.execute(page.options(_with_owner))
+    await db.execute(page.with_only_columns(models.Post.id, models.Post.updated_at))
+    await db.execute(_page_query(10, 0, "", "substring", (datetime.now(timezone.utc), 0)).options(_with_owner))
+    await db.execute(_hot_query(10))
+    await db.execute(_posts_with_votes().filter(models.Post.id == 0))
+    await db.execute(select(models.Post.updated_at).where(models.Post.id == 0))
+    await db.execute(_delete_statement(0, 0))
+
+def warm_validators():
+    # Validates and serializes a sample post through the response schemas
+    now = datetime.now(timezone.utc)
+    owner = models.User(id=0, email="warmup@example.com", password="", created_at=now)
+    post = models.Post(id=0, title="", content="", published=True, created_at=now, updated_at=now,
+                       owner_id=0, vote_count=0, owner=owner)
+    _format_posts([post])
+    _format_post(post)
@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from .. import utils, oauth2, cache, database, limits, metrics, ranking, votes, warmup
+
+router = APIRouter(
+    tags=["Stats"]
+)
+
+def collect_stats() -> dict:
+    return {
+        "db_pool": database.pool_stats(),
+        "db_replicas": database.replicas.stats(),
+        "password_hashing": utils.hasher.stats(),
+        "user_cache": oauth2.user_cache.stats(),
+        "response_cache": cache.response_cache.stats(),
+        "hot_posts": ranking.stats(),
+        "admission": limits.admission.stats(),
+        "rate_limits": limits.rate_limiter.stats(),
+        "vote_buffer": votes.vote_buffer.stats(),
+        "warmup": warmup.stats(),
+    }
+
+@router.get("/stats/")
+async def get_stats():
+    return collect_stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(collect_stats()), media_type="text/plain; version=0.0.4")
@@ -1,36 +1,64 @@
-from fastapi import Depends, HTTPException, status, APIRouter
-from sqlalchemy.orm import Session
-from .. import models, utils
-from ..schemes import UserOut, UserCreate
-from ..database import get_db
+from fastapi import Depends, HTTPException, Request, Response, status, APIRouter
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import conditional, database, models, oauth2, utils
+from ..schemes import UserOut, UserCreate, UserStats
+from ..database import get_db, get_read_db
 
 router = APIRouter(
     prefix="/users",
-    tags=['Users']
+    tags=['Users'],
+    default_response_class=ORJSONResponse
 )
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=UserOut, )
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if existing_user:
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    user_dict = user.model_dump()
+    user_dict['password'] = await utils.hasher.hash(user_dict['password'])
+
+    # The unique email index settles concurrent signups, no check-then-insert race
+    new_user = (await db.execute(
+        insert(models.User).values(**user_dict).on_conflict_do_nothing(index_elements=[models.User.email])
+        .returning(models.User.id, models.User.email, models.User.created_at))).first()
+    if new_user is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User with this email already exists"
         )
-    
-    user_dict = user.model_dump()
-    user_dict['password'] = utils.hash(user_dict['password'])
-    new_user = models.User(**user_dict)
-    
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+
+    await db.commit()
+    oauth2.invalidate_user(new_user.id)
+    # The new user has no token yet for oauth2.track_writers to see
+    database.replicas.mark_write(new_user.id)
     return new_user
 
 @router.get("/{id}", response_model=UserOut)
-def get_user(id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
+async def get_user(id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    user = await db.get(models.User, id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                           detail=f"user with id: {id} was not found")
-    return user
\ No newline at end of file
+    # Users are never modified, so created_at versions them
+    etag = conditional.make_etag((user.id, user.created_at.isoformat()))
+    if conditional.not_modified(request, etag, user.created_at):
+        return conditional.not_modified_response(etag, user.created_at)
+    response.headers.update(conditional.validators(etag, user.created_at))
+    return user
+
+@router.get("/{id}/stats", response_model=UserStats)
+async def get_user_stats(id: int, db: AsyncSession = Depends(get_read_db)):
+    # A primary key lookup on users and on the maintained user_stats row.
+    # Users who never posted have no row yet
+    stats = (await db.execute(
+        select(models.User.id.label("user_id"),
+               func.coalesce(models.UserStats.post_count, 0).label("post_count"),
+               func.coalesce(models.UserStats.votes_received, 0).label("votes_received"),
+               models.UserStats.last_post_at)
+        .outerjoin(models.UserStats, models.UserStats.user_id == models.User.id)
+        .where(models.User.id == id))).first()
+    if not stats:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                          detail=f"user with id: {id} was not found")
+    return stats
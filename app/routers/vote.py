@@ -1,35 +1,94 @@
-from fastapi import Depends, HTTPException, status, APIRouter
-from sqlalchemy.orm import Session
+from typing import List
+from fastapi import Body, Depends, HTTPException, status, APIRouter
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
-from .. import models, oauth2
-from ..schemes import Vote
+from .. import models, oauth2, user_stats
+from ..schemes import Vote, VoteResult
+from ..config import settings
+from ..cache import invalidate_posts
+from ..votes import apply_votes, vote_buffer
 
 router = APIRouter(
     prefix="/vote",
-    tags=["Vote"]
+    tags=["Vote"],
+    default_response_class=ORJSONResponse
 )
 
+def _post_not_found(post_id: int):
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"post with id: {post_id} was not found")
+
+def _vote_statement(user_id: int, post_id: int, dir: int):
+    # The vote row and posts.vote_count change in one statement: a
+    # data-modifying CTE feeds the row it touched into the counter UPDATE
+    if dir == 1:
+        # Inserting from posts skips a missing post instead of failing the foreign key
+        changed = insert(models.Vote).from_select(
+            ["user_id", "post_id"], select(literal(user_id), models.Post.id).where(models.Post.id == post_id)
+        ).on_conflict_do_nothing().returning(models.Vote.post_id).cte("changed")
+        delta = 1
+    else:
+        changed = delete(models.Vote).where(
+            models.Vote.post_id == post_id, models.Vote.user_id == user_id
+        ).returning(models.Vote.post_id).cte("changed")
+        delta = -1
+
+    # ...and the counter UPDATE feeds the post owner's votes_received
+    counted = (
+        update(models.Post).where(models.Post.id == changed.c.post_id)
+        .values(vote_count=models.Post.vote_count + delta)
+        .returning(models.Post.id, models.Post.owner_id, literal(delta).label("delta"))
+        .cte("counted"))
+    return select(counted.c.id).add_cte(user_stats.count_votes_received(counted).cte("stats"))
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def vote(vote: Vote, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    vote_query = db.query(models.Vote).filter(models.Vote.post_id == vote.post_id, models.Vote.user_id == current_user.id)
+async def vote(vote: Vote, db: AsyncSession = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    if settings.vote_buffer_enabled:
+        # Write-behind: acknowledged once queued, applied by the flush worker.
+        # Missing posts and no-op votes are dropped then, not reported
+        if not vote_buffer.add(current_user.id, vote.post_id, vote.dir):
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, try again later",
+                                headers={"Retry-After": "1"})
+        return ORJSONResponse({"message": "vote accepted"}, status_code=status.HTTP_202_ACCEPTED)
 
-    post = db.query(models.Post).filter(models.Post.id == vote.post_id).first()
-    if not post:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"post with id: {vote.post_id} was not found")
+    counted = await db.scalar(_vote_statement(current_user.id, vote.post_id, vote.dir))
 
-    found_vote = vote_query.first()
-    if vote.dir == 1:
-        if found_vote:
+    if counted is None:
+        # Nothing changed: tell a missing post apart from a no-op vote
+        if await db.scalar(select(models.Post.id).where(models.Post.id == vote.post_id)) is None:
+            raise _post_not_found(vote.post_id)
+        if vote.dir == 1:
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"user {current_user.id} has already voted on post {vote.post_id}")
-        new_vote = models.Vote(post_id = vote.post_id, user_id = current_user.id)
-        db.add(new_vote)
-        db.commit()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vote does not exist")
+
+    await db.commit()
+    await invalidate_posts(vote.post_id)
+    if vote.dir == 1:
         return {"message": "successfully added vote"}
-    else:
-        if not found_vote:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vote does not exist")
-        vote_query.delete(synchronize_session=False)
-        db.commit()
-        return {"message": "successfully deleted vote"}
+    return {"message": "successfully deleted vote"}
+
+@router.post("/batch", response_model=List[VoteResult])
+async def vote_batch(votes: List[Vote] = Body(max_length=settings.vote_batch_max_size), db: AsyncSession = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    # The last entry for a post wins, earlier ones are reported as superseded
+    final = {(current_user.id, vote.post_id): vote.dir for vote in votes}
+    results = {post_id: result for (_, post_id), result in (await apply_votes(db, final)).items()}
+    await db.commit()
+    changed = [post_id for post_id, result in results.items() if result in ("added", "deleted")]
+    if changed:
+        await invalidate_posts(*changed)
 
+    last_index = {vote.post_id: index for index, vote in enumerate(votes)}
+    return [
+        {
+            "post_id": vote.post_id,
+            "dir": vote.dir,
+            "status": results[vote.post_id] if last_index[vote.post_id] == index else "superseded"
+        } for index, vote in enumerate(votes)
+    ]
 
+async def warm_up(db: AsyncSession):
+    # Both vote directions on a post id that matches no row, see warmup.warm_up
+    for dir in (1, 0):
+        await db.scalar(_vote_statement(0, 0, dir))
@@ -22,6 +22,13 @@ class User(UserBase):
     created_at: datetime
     model_config = ConfigDict(from_attributes=True)
 
+class UserStats(BaseModel):
+    user_id: int
+    post_count: int
+    votes_received: int
+    last_post_at: Optional[datetime] = None
+    model_config = ConfigDict(from_attributes=True)
+
 # Auth
 class UserLogin(BaseModel):
     email: EmailStr
@@ -68,3 +75,6 @@ class Vote(BaseModel):
     post_id: int
     dir: int = Field(ge=0, le=1)
 
+class VoteResult(Vote):
+    # added, deleted, already_voted, not_voted, post_not_found or superseded
+    status: str
@@ -0,0 +1,109 @@
+"""Production server.
+
+    python -m app.server
+
+Runs gunicorn with uvicorn workers, sized and tuned by the server_* settings.
+"""
+import logging
+import math
+import os
+from typing import Optional
+from gunicorn.app.base import BaseApplication
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+def cgroup_cpu_limit(root: str = "/sys/fs/cgroup") -> Optional[int]:
+    # CPUs a container's CFS quota allows, from cgroup v2 or else v1; None
+    # when there is no quota
+    try:
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()
+        if quota == "max":
+            return None
+    except OSError:
+        try:
+            with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+                quota = f.read().strip()
+            with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+                period = f.read().strip()
+        except OSError:
+            return None
+        if int(quota) <= 0:
+            return None
+    return max(1, math.ceil(int(quota) / int(period)))
+
+def cpu_count() -> int:
+    # CPUs this process may run on, which can be fewer than the machine has:
+    # its affinity mask, capped by the container's CPU quota
+    if hasattr(os, "sched_getaffinity"):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return min(count, limit) if limit else count
+
+def worker_count(settings) -> int:
+    # server_workers=0 runs one worker per CPU
+    return settings.server_workers if settings.server_workers > 0 else cpu_count()
+
+def check_workers(settings, workers: int):
+    # Runs in the master before the app is imported, so changed settings
+    # apply to every worker. State a worker keeps to itself is wrong as soon
+    # as there are several
+    if workers <= 1:
+        return
+    if settings.response_cache_backend == "memory":
+        # A worker would keep serving its cached copy after a write in another
+        logger.warning("turning the memory response cache off for %d workers; "
+                       "set RESPONSE_CACHE_BACKEND=redis to share one", workers)
+        settings.response_cache_backend = "none"
+    if settings.rate_limits and settings.rate_limit_backend == "memory":
+        # Every worker would allow the full limit
+        raise SystemExit(f"refusing to run {workers} workers with per-process rate limits; "
+                         "set RATE_LIMIT_BACKEND=redis or SERVER_WORKERS=1")
+    if settings.db_replica_urls:
+        logger.warning("with %d workers, a user's reads only stay on the primary after a write "
+                       "in the worker that handled it", workers)
+
+def server_options(settings) -> dict:
+    return {
+        "bind": f"{settings.server_host}:{settings.server_port}",
+        "workers": worker_count(settings),
+        "worker_class": "uvicorn_worker.UvicornWorker",
+        # The app is imported once in the master and forked, so workers start
+        # without importing it again. Nothing connects to the database at
+        # import; each worker opens its own pool in its lifespan warmup
+        "preload_app": True,
+        # Restarting a worker after this many requests bounds its memory
+        # growth; the jitter keeps workers from restarting together
+        "max_requests": settings.server_max_requests,
+        "max_requests_jitter": settings.server_max_requests_jitter,
+        # On SIGTERM workers stop accepting, fail /ready and get this long to
+        # finish in-flight requests before they are killed
+        "graceful_timeout": settings.server_graceful_timeout_seconds,
+        "timeout": settings.server_worker_timeout_seconds,
+        "keepalive": settings.server_keepalive_seconds,
+        "accesslog": "-" if settings.server_access_log else None,
+    }
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for name, value in self.options.items():
+            self.cfg.set(name, value)
+
+    def load(self):
+        from .main import app
+        return app
+
+def main():
+    options = server_options(settings)
+    check_workers(settings, options["workers"])
+    Server(options).run()
+
+if __name__ == "__main__":
+    main()
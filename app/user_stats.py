@@ -0,0 +1,58 @@
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+
+# Statements keeping user_stats in step with posts and votes. Each takes the
+# CTE of the write it follows, so the write and its aggregate update run as a
+# single statement
+
+def count_new_posts(posts):
+    # posts: rows with owner_id and created_at that were just inserted
+    new = select(posts.c.owner_id, func.count().label("posts"), func.max(posts.c.created_at).label("last_post_at")).group_by(posts.c.owner_id)
+    stmt = insert(models.UserStats).from_select(["user_id", "post_count", "last_post_at"], new)
+    return stmt.on_conflict_do_update(index_elements=[models.UserStats.user_id], set_={
+        "post_count": models.UserStats.post_count + stmt.excluded.post_count,
+        "last_post_at": func.greatest(models.UserStats.last_post_at, stmt.excluded.last_post_at),
+    })
+
+def uncount_deleted_post(deleted):
+    # deleted: the id, owner_id and vote_count of a deleted post. The subquery
+    # still sees the post, so it is excluded by id
+    previous_post = select(func.max(models.Post.created_at)).where(
+        models.Post.owner_id == deleted.c.owner_id, models.Post.id != deleted.c.id).scalar_subquery()
+    return update(models.UserStats).where(models.UserStats.user_id == deleted.c.owner_id).values(
+        post_count=models.UserStats.post_count - 1,
+        votes_received=models.UserStats.votes_received - deleted.c.vote_count,
+        last_post_at=previous_post,
+    )
+
+def count_votes_received(counted):
+    # counted: owner_id and delta of each post whose vote_count changed
+    owners = select(counted.c.owner_id, func.sum(counted.c.delta).label("delta")).group_by(counted.c.owner_id).subquery()
+    return update(models.UserStats).where(models.UserStats.user_id == owners.c.owner_id).values(
+        votes_received=models.UserStats.votes_received + owners.c.delta)
+
+_REBUILD = """
+    WITH received AS (
+        SELECT post_id, count(*) AS votes FROM votes GROUP BY post_id
+    ), totals AS (
+        SELECT p.owner_id, count(*) AS posts, coalesce(sum(r.votes), 0) AS votes, max(p.created_at) AS last_post_at
+        FROM posts p LEFT JOIN received r ON r.post_id = p.id
+        GROUP BY p.owner_id
+    ), upserted AS (
+        INSERT INTO user_stats (user_id, post_count, votes_received, last_post_at)
+        SELECT owner_id, posts, votes, last_post_at FROM totals
+        ON CONFLICT (user_id) DO UPDATE SET post_count = excluded.post_count,
+            votes_received = excluded.votes_received, last_post_at = excluded.last_post_at
+        RETURNING user_id
+    )
+    DELETE FROM user_stats s WHERE NOT EXISTS (SELECT 1 FROM totals WHERE totals.owner_id = s.user_id)
+"""
+
+async def rebuild_user_stats(db: AsyncSession) -> int:
+    # Recomputes every row from posts and votes, not from posts.vote_count, so
+    # it also corrects stats that drifted with it; users without posts have no row
+    await db.execute(text(_REBUILD))
+    await db.commit()
+    return await db.scalar(select(func.count()).select_from(models.UserStats))
@@ -1,4 +1,9 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import bcrypt
+from fastapi import HTTPException, status
+from .config import settings
 
 def hash(password: str) -> str:
     # Convert the password to bytes and generate salt
@@ -16,4 +21,68 @@ def verify(plain_password: str, hashed_password: str) -> bool:
     # Verify and return result
     return bcrypt.checkpw(plain_password_bytes, hashed_password_bytes)
 
+class PasswordHasher:
+    # Runs bcrypt in a worker pool so a login burst can't freeze the event loop,
+    # and sheds load with a 503 once more than queue_size calls are waiting
+    def __init__(self, workers: int, queue_size: int, use_processes: bool = False):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.use_processes = use_processes
+        self._executor = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
 
+    def _get_executor(self):
+        # Created lazily so that forked server workers each get their own pool
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": "1"},
+            )
+
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(self.total_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_latency_ms": round(self.max_seconds * 1000, 2),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+hasher = PasswordHasher(settings.hash_workers, settings.hash_queue_size, settings.hash_use_processes)
@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import Counter
+from sqlalchemy import Integer, column, delete, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, user_stats
+from .cache import invalidate_posts
+from .config import settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+def _pairs(keys, name: str):
+    return values(column("user_id", Integer), column("post_id", Integer), name=name).data(keys)
+
+async def apply_votes(db: AsyncSession, votes: dict) -> dict:
+    # Applies {(user_id, post_id): dir} with set-based statements in the
+    # caller's transaction and returns {(user_id, post_id): status}. Keys are
+    # sorted so concurrent batches lock rows in the same order
+    to_add = sorted(key for key, dir in votes.items() if dir == 1)
+    to_delete = sorted(key for key, dir in votes.items() if dir == 0)
+
+    added, deleted = set(), set()
+    if to_add:
+        # Joining posts and users skips ids that don't exist instead of failing a foreign key
+        wanted = _pairs(to_add, "wanted")
+        added = {tuple(row) for row in await db.execute(
+            insert(models.Vote)
+            .from_select(["user_id", "post_id"], select(models.User.id, models.Post.id).select_from(wanted)
+                         .join(models.Post, models.Post.id == wanted.c.post_id)
+                         .join(models.User, models.User.id == wanted.c.user_id))
+            .on_conflict_do_nothing()
+            .returning(models.Vote.user_id, models.Vote.post_id)
+        )}
+    if to_delete:
+        deleted = {tuple(row) for row in await db.execute(
+            delete(models.Vote)
+            .where(tuple_(models.Vote.user_id, models.Vote.post_id).in_(to_delete))
+            .returning(models.Vote.user_id, models.Vote.post_id)
+        )}
+
+    deltas = Counter(post_id for _, post_id in added)
+    deltas.subtract(post_id for _, post_id in deleted)
+    deltas = sorted((post_id, delta) for post_id, delta in deltas.items() if delta)
+    if deltas:
+        changes = values(column("post_id", Integer), column("delta", Integer), name="changes").data(deltas)
+        counted = (
+            update(models.Post)
+            .where(models.Post.id == changes.c.post_id)
+            .values(vote_count=models.Post.vote_count + changes.c.delta)
+            .returning(models.Post.owner_id, changes.c.delta)
+            .cte("counted"))
+        await db.execute(user_stats.count_votes_received(counted).execution_options(synchronize_session=False))
+
+    # Anything not applied either targets a missing post or was already in the requested state
+    unchanged = votes.keys() - added - deleted
+    existing = set()
+    if unchanged:
+        existing = set((await db.execute(
+            select(models.Post.id).where(models.Post.id.in_({post_id for _, post_id in unchanged}))
+        )).scalars())
+
+    results = {}
+    for key, dir in votes.items():
+        if key in added:
+            results[key] = "added"
+        elif key in deleted:
+            results[key] = "deleted"
+        elif key[1] not in existing:
+            results[key] = "post_not_found"
+        else:
+            results[key] = "already_voted" if dir == 1 else "not_voted"
+    return results
+
+class VoteBuffer:
+    # Write-behind votes. POST /vote/ queues a vote and returns at once, and a
+    # worker applies the queue with apply_votes in batches, when batch_size
+    # votes are pending or every flush_interval seconds. A newer vote by the
+    # same user on the same post replaces the pending one, so toggles collapse
+    # before they reach the database. Past max_pending queued votes new ones are
+    # refused, which the router turns into a 503
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._ready = None
+        self.accepted = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.applied = 0
+        self.flush_errors = 0
+        self.last_flush_seconds = 0.0
+
+    def add(self, user_id: int, post_id: int, dir: int) -> bool:
+        key = (user_id, post_id)
+        if key in self._pending:
+            self.coalesced += 1
+        elif len(self._pending) >= self.max_pending:
+            self.rejected += 1
+            return False
+        self._pending[key] = dir
+        self.accepted += 1
+        if self._ready is not None and len(self._pending) >= self.batch_size:
+            self._ready.set()
+        return True
+
+    async def flush(self, session_factory=SessionLocal) -> int:
+        # Applies everything pending, a batch per transaction
+        flushed = 0
+        while self._pending:
+            batch = dict(itertools.islice(self._pending.items(), self.batch_size))
+            for key in batch:
+                del self._pending[key]
+            start = time.perf_counter()
+            try:
+                async with session_factory() as db:
+                    results = await apply_votes(db, batch)
+                    await db.commit()
+            except BaseException:
+                # Put the batch back, behind any newer vote for the same key
+                self.flush_errors += 1
+                self._pending = {**batch, **self._pending}
+                raise
+            applied = [post_id for (_, post_id), result in results.items() if result in ("added", "deleted")]
+            if applied:
+                await invalidate_posts(*set(applied))
+            self.flushes += 1
+            self.flushed += len(batch)
+            self.applied += len(applied)
+            self.last_flush_seconds = time.perf_counter() - start
+            flushed += len(batch)
+        return flushed
+
+    async def run(self):
+        self._ready = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._ready.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("vote buffer flush failed")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.vote_buffer_enabled,
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "accepted": self.accepted,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "applied": self.applied,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 3),
+        }
+
+vote_buffer = VoteBuffer(settings.vote_buffer_batch_size, settings.vote_buffer_flush_interval_seconds,
+                         settings.vote_buffer_max_pending)
@@ -0,0 +1,78 @@
+"""Concurrent-request throughput against a running API.
+
+Start the server (e.g. `uvicorn app.main:app --port 8000`) on the revision you
+want to measure, then run:
+
+    python -m benchmarks.concurrency --url http://localhost:8000 \
+        --email bench@example.com --password bench --concurrency 50 --requests 2000
+
+Run it once on the sync baseline and once on the async database layer with the
+same arguments to compare requests/second and latency.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    # Creating the user is allowed to fail if it already exists
+    await client.post("/users/", json={"email": email, "password": password})
+    response = await client.post("/login", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run(url: str, email: str, password: str, concurrency: int, requests: int, path: str) -> dict:
+    async with httpx.AsyncClient(base_url=url, timeout=30) as client:
+        token = await _login(client, email, password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        latencies = []
+        errors = 0
+        remaining = iter(range(requests))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email", default="bench@example.com")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--path", default="/posts/")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url, args.email, args.password, args.concurrency, args.requests, args.path))
+    for key, value in result.items():
+        print(f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Drive every API route at a given concurrency and report latency as JSON.
+
+    python -m benchmarks.load --concurrency 20 --requests 500 --output run.json
+    python -m benchmarks.load --url http://localhost:8000 --routes list_posts get_post
+
+Seed the database first with `python -m benchmarks.seed`. By default the app
+runs in-process through httpx's ASGI transport. In that mode the SQL statements
+each request issues are counted as well. With --url the benchmark drives a
+running server instead, and queries_per_request is null. Each route runs on
+its own, so the figures for one route are not mixed with another's. Rate
+limits apply as configured; set RATE_LIMITS='{}' to measure raw capacity.
+
+Compare two runs with any JSON diff, e.g.
+`jq '.routes.list_posts.p95_ms' before.json after.json`.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import time
+
+import httpx
+from sqlalchemy import event, text
+
+from app.database import SessionLocal, engine
+from app.oauth2 import create_access_token
+
+from .seed import PASSWORD
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Context:
+    # Ids sampled from the seeded data, and the posts each route may modify
+    def __init__(self, user_ids, post_ids, emails):
+        self.user_ids = user_ids
+        self.post_ids = post_ids
+        self.emails = emails
+        self.tokens = {user_id: create_access_token({"user_id": user_id}) for user_id in user_ids}
+        self.own_posts = {}
+        self.created = []
+        self.cursors = []
+
+    def auth(self, user_id=None):
+        user_id = user_id or random.choice(self.user_ids)
+        return user_id, {"Authorization": f"Bearer {self.tokens[user_id]}"}
+
+
+async def load_context(sample_size: int) -> Context:
+    async with SessionLocal() as db:
+        users = (await db.execute(text(
+            "SELECT id, email FROM users WHERE email LIKE 'bench%@example.com' ORDER BY random() LIMIT :n"
+        ), {"n": sample_size})).all()
+        post_ids = (await db.execute(text("SELECT id FROM posts ORDER BY random() LIMIT :n"), {"n": sample_size * 10})).scalars().all()
+        if not users or not post_ids:
+            raise SystemExit("no seeded data found, run `python -m benchmarks.seed` first")
+        context = Context([user.id for user in users], list(post_ids), {user.id: user.email for user in users})
+        for user_id in context.user_ids:
+            owned = (await db.execute(text("SELECT id FROM posts WHERE owner_id = :id LIMIT 1"), {"id": user_id})).scalar()
+            if owned:
+                context.own_posts[user_id] = owned
+    return context
+
+
+# -- Routes --
+# Each takes the client and the context and returns the response
+
+async def login(client, ctx):
+    user_id = random.choice(ctx.user_ids)
+    return await client.post("/login", data={"username": ctx.emails[user_id], "password": PASSWORD})
+
+async def list_posts(client, ctx):
+    _, headers = ctx.auth()
+    return await client.get("/posts/", params={"limit": 20}, headers=headers)
+
+async def search_posts(client, ctx):
+    _, headers = ctx.auth()
+    term = random.choice(["python", "postgres", "fastapi", "cats", "travel", "music"])
+    return await client.get("/posts/", params={"limit": 20, "search": term}, headers=headers)
+
+async def fulltext_search_posts(client, ctx):
+    _, headers = ctx.auth()
+    term = random.choice(["python", "postgres", "fastapi", "cats", "travel", "music"])
+    return await client.get("/posts/", params={"limit": 20, "search": term, "search_mode": "fulltext"}, headers=headers)
+
+async def paginate_posts(client, ctx):
+    # Follows next cursors deeper and deeper into the feed
+    _, headers = ctx.auth()
+    params = {"limit": 20}
+    if ctx.cursors:
+        params["cursor"] = ctx.cursors.pop()
+    response = await client.get("/posts/", params=params, headers=headers)
+    if "X-Next-Cursor" in response.headers:
+        ctx.cursors.append(response.headers["X-Next-Cursor"])
+    return response
+
+async def deep_offset_posts(client, ctx):
+    _, headers = ctx.auth()
+    return await client.get("/posts/", params={"limit": 20, "skip": random.randint(0, len(ctx.post_ids) * 10)}, headers=headers)
+
+async def hot_posts(client, ctx):
+    _, headers = ctx.auth()
+    return await client.get("/posts/hot", params={"limit": 20}, headers=headers)
+
+async def get_post(client, ctx):
+    _, headers = ctx.auth()
+    return await client.get(f"/posts/{random.choice(ctx.post_ids)}", headers=headers)
+
+async def get_user(client, ctx):
+    return await client.get(f"/users/{random.choice(ctx.user_ids)}")
+
+async def vote(client, ctx):
+    _, headers = ctx.auth()
+    return await client.post("/vote/", json={"post_id": random.choice(ctx.post_ids), "dir": random.randint(0, 1)}, headers=headers)
+
+async def create_post(client, ctx):
+    user_id, headers = ctx.auth()
+    response = await client.post("/posts/", json={"title": "benchmark post", "content": "benchmark content"}, headers=headers)
+    if response.status_code == 201:
+        ctx.created.append((user_id, response.json()["id"]))
+    return response
+
+async def update_post(client, ctx):
+    user_id, headers = ctx.auth(random.choice(list(ctx.own_posts)))
+    return await client.put(f"/posts/{ctx.own_posts[user_id]}", json={"title": "updated title", "content": "updated content"}, headers=headers)
+
+async def delete_post(client, ctx):
+    # Deletes the posts create_post made, so run it after create_post
+    if not ctx.created:
+        return None
+    user_id, post_id = ctx.created.pop()
+    _, headers = ctx.auth(user_id)
+    return await client.delete(f"/posts/{post_id}", headers=headers)
+
+ROUTES = {
+    "login": login,
+    "list_posts": list_posts,
+    "search_posts": search_posts,
+    "fulltext_search_posts": fulltext_search_posts,
+    "paginate_posts": paginate_posts,
+    "deep_offset_posts": deep_offset_posts,
+    "hot_posts": hot_posts,
+    "get_post": get_post,
+    "get_user": get_user,
+    "vote": vote,
+    "create_post": create_post,
+    "update_post": update_post,
+    "delete_post": delete_post,
+}
+
+
+async def run_route(client, ctx, route, concurrency: int, requests: int, statements) -> dict:
+    latencies = []
+    statuses = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await route(client, ctx)
+            if response is None:
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    statements_before = statements[0] if statements else None
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    completed = len(latencies)
+    return {
+        "requests": completed,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if completed else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if completed else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if completed else None,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "queries_per_request": round((statements[0] - statements_before) / completed, 2) if statements and completed else None,
+    }
+
+
+async def run(url, routes, concurrency: int, requests: int, sample_size: int) -> dict:
+    ctx = await load_context(sample_size)
+
+    statements = None
+    if url is None:
+        from app.main import app
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://benchmark"
+        # Count statements on the app's own engine
+        statements = [0]
+        def count(*args):
+            statements[0] += 1
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+    else:
+        transport = None
+        base_url = url
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60, limits=limits) as client:
+        results = {}
+        for name in routes:
+            results[name] = await run_route(client, ctx, ROUTES[name], concurrency, requests, statements)
+
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "target": url or "in-process",
+        "python": platform.python_version(),
+        "concurrency": concurrency,
+        "requests_per_route": requests,
+        "routes": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="drive a running server instead of the app in-process")
+    parser.add_argument("--routes", nargs="+", choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--sample-size", type=int, default=200, help="seeded users to act as")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for request parameters")
+    parser.add_argument("--output", help="write the JSON report to this file as well as stdout")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(run(args.url, args.routes, args.concurrency, args.requests, args.sample_size))
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
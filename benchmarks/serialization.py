@@ -0,0 +1,83 @@
+"""Serialization cost of a page of posts, without a database or a server.
+
+    python -m benchmarks.serialization --posts 1000 --repeat 20
+
+Builds in-memory Post objects with owners and times turning them into the JSON
+bytes of a GET /posts response, per --posts posts, two ways:
+
+- dict_path: the old path. Each post's __dict__ is copied into a dict and
+  validated and dumped by PostWithVotes. FastAPI then validates the list
+  against response_model again and encodes it with the stdlib json module.
+- adapter_path: the path the post router uses now. A compiled
+  TypeAdapter(List[PostWithVotes]) validates straight from the ORM objects and
+  dumps JSON in one pass.
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app import models
+from app.schemes import PostWithVotes
+
+post_list = TypeAdapter(List[PostWithVotes])
+
+
+def make_posts(count: int):
+    now = datetime.now(timezone.utc)
+    owners = [models.User(id=i, email=f"bench{i}@example.com", password="x", created_at=now) for i in range(1, 51)]
+    return [
+        models.Post(id=i, title=f"post {i}", content="lorem ipsum dolor sit amet " * 5, published=True,
+                    created_at=now - timedelta(minutes=i), owner_id=owners[i % 50].id, owner=owners[i % 50], vote_count=i % 97)
+        for i in range(1, count + 1)
+    ]
+
+
+def dict_path(posts) -> bytes:
+    data = [PostWithVotes.model_validate({**post.__dict__, "votes": post.vote_count, "owner": post.owner},
+                                         from_attributes=True).model_dump(mode="json") for post in posts]
+    validated = post_list.validate_python(data)
+    return json.dumps(jsonable_encoder(post_list.dump_python(validated, mode="json"))).encode()
+
+
+def adapter_path(posts) -> bytes:
+    return post_list.dump_json(post_list.validate_python(posts, from_attributes=True))
+
+
+def measure(function, posts, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(posts)
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    posts = make_posts(args.posts)
+    # Both paths must produce the same document
+    assert json.loads(dict_path(posts)) == json.loads(adapter_path(posts))
+    report = {
+        "posts": args.posts,
+        "dict_path": measure(dict_path, posts, args.repeat),
+        "adapter_path": measure(adapter_path, posts, args.repeat),
+    }
+    report["speedup"] = round(report["dict_path"]["median_ms"] / report["adapter_path"]["median_ms"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Cold start of a worker: import time, startup time and its first requests.
+
+    python -m benchmarks.startup --repeat 3 --requests 50
+
+Each measurement runs in a fresh Python process, so nothing is compiled,
+pooled or imported yet, the way an autoscaled worker starts. The process
+times, from its own start:
+
+- import_ms: importing app.main, which builds the settings, the engine and
+  the module-level app
+- create_app_ms: building one more app with create_app()
+- startup_ms: the lifespan startup, i.e. until GET /ready would answer 200.
+  This is where the warmup runs
+- per route, the latency of the first request, the median (p50) of the
+  --requests that follow, and first_fast_ms: the time since process start
+  until a request to it came back within twice that median
+
+It runs with the warmup off (WARMUP_DB_CONNECTIONS=0) and on, and reports
+the median of --repeat processes for each. Requests go through httpx's ASGI
+transport with the response cache and rate limits off, so every request
+reaches the database. Seed it first with `python -m benchmarks.seed`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+STARTED = time.perf_counter()
+
+ROUTES = ("get_post", "list_posts", "hot_posts", "vote")
+
+
+def since_start() -> float:
+    return (time.perf_counter() - STARTED) * 1000
+
+
+async def child(token: str, post_id: int, requests: int) -> dict:
+    # Runs in the measured process. The app is only imported here
+    start = time.perf_counter()
+    from app.main import create_app
+    import_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    app = create_app()
+    create_app_ms = (time.perf_counter() - start) * 1000
+
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"}
+    calls = {
+        "get_post": lambda client, i: client.get(f"/posts/{post_id}", headers=headers),
+        "list_posts": lambda client, i: client.get("/posts/", params={"limit": 20}, headers=headers),
+        "hot_posts": lambda client, i: client.get("/posts/hot", params={"limit": 20}, headers=headers),
+        # Alternates adding and removing the same vote, so each call writes
+        "vote": lambda client, i: client.post("/vote/", json={"post_id": post_id, "dir": (i + 1) % 2}, headers=headers),
+    }
+
+    report = {"import_ms": import_ms, "create_app_ms": create_app_ms}
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        report["startup_ms"] = (time.perf_counter() - start) * 1000
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+            # Removes the vote first, so the alternation starts from no vote
+            await client.post("/vote/", json={"post_id": post_id, "dir": 0}, headers=headers)
+            for name in ROUTES:
+                latencies, finished = [], []
+                for i in range(requests + 1):
+                    request_start = time.perf_counter()
+                    response = await calls[name](client, i)
+                    latencies.append((time.perf_counter() - request_start) * 1000)
+                    finished.append(since_start())
+                    if response.status_code >= 400:
+                        raise SystemExit(f"{name} answered {response.status_code}: {response.text}")
+                p50 = statistics.median(latencies[1:])
+                report[name] = {
+                    "first_ms": latencies[0],
+                    "p50_ms": p50,
+                    "first_fast_ms": next(at for latency, at in zip(latencies, finished) if latency <= 2 * p50),
+                }
+    return report
+
+
+def sample_ids():
+    from sqlalchemy import text
+    from app.database import SessionLocal
+    from app.oauth2 import create_access_token
+
+    async def load():
+        async with SessionLocal() as db:
+            row = (await db.execute(text(
+                "SELECT u.id, p.id FROM users u JOIN posts p ON p.owner_id <> u.id "
+                "WHERE u.email LIKE 'bench%@example.com' LIMIT 1"))).first()
+        if row is None:
+            raise SystemExit("no seeded data found, run `python -m benchmarks.seed` first")
+        return create_access_token({"user_id": row[0]}), row[1]
+
+    return asyncio.run(load())
+
+
+def run_process(token: str, post_id: int, requests: int, warmup_connections: int) -> dict:
+    env = {**os.environ, "WARMUP_DB_CONNECTIONS": str(warmup_connections),
+           "RESPONSE_CACHE_BACKEND": "none", "RATE_LIMITS": "{}"}
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", token, str(post_id), "--requests", str(requests)],
+        env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def median_report(runs):
+    # Median of every figure over the runs, keeping the report's shape
+    first = runs[0]
+    if isinstance(first, dict):
+        return {key: median_report([run[key] for run in runs]) for key in first}
+    return round(statistics.median(runs), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="processes per mode")
+    parser.add_argument("--requests", type=int, default=50, help="requests per route after the first")
+    parser.add_argument("--warmup-connections", type=int, default=5)
+    parser.add_argument("--child", nargs=2, metavar=("TOKEN", "POST_ID"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        token, post_id = args.child
+        print(json.dumps(asyncio.run(child(token, int(post_id), args.requests))))
+        return
+
+    token, post_id = sample_ids()
+    report = {"python": sys.version.split()[0], "repeat": args.repeat, "requests_per_route": args.requests}
+    for mode, connections in (("cold", 0), ("warm", args.warmup_connections)):
+        runs = [run_process(token, post_id, args.requests, connections) for _ in range(args.repeat)]
+        report[mode] = median_report(runs)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Throughput of the production server with one worker and with N.
+
+    python -m benchmarks.workers --workers 4 --routes login get_post list_posts
+
+Starts `python -m app.server` once per worker count on a local port, waits
+for GET /ready, drives the routes with benchmarks.load over HTTP and stops
+the server with SIGTERM, as an orchestrator would. --workers defaults to
+one per CPU. Rate limits are turned off so they do not cap the throughput,
+and so is the response cache, which the server turns off for several workers
+anyway when it uses the per-process memory backend.
+Seed the database first with `python -m benchmarks.seed`.
+
+login is the bcrypt-bound route. With one worker, every hash shares that
+process's CPU. It should scale with the worker count up to the number of
+cores.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+from app.config import settings
+from app.database import engine
+from app.server import cpu_count
+
+from . import load
+
+
+def wait_ready(url: str, process, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"server exited with {process.returncode}")
+        try:
+            if httpx.get(f"{url}/ready", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"server not ready after {timeout}s")
+
+
+async def drive(url: str, args) -> dict:
+    try:
+        return await load.run(url, args.routes, args.concurrency, args.requests, args.sample_size)
+    finally:
+        # Its pooled connections belong to this event loop
+        await engine.dispose()
+
+
+def measure(workers: int, args) -> dict:
+    url = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, "SERVER_HOST": "127.0.0.1", "SERVER_PORT": str(args.port),
+           "SERVER_WORKERS": str(workers), "RATE_LIMITS": "{}", "RESPONSE_CACHE_BACKEND": "none"}
+    process = subprocess.Popen([sys.executable, "-m", "app.server"], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(url, process, args.startup_timeout)
+        report = asyncio.run(drive(url, args))
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(settings.server_graceful_timeout_seconds + 5)
+    return {name: {key: route[key] for key in ("throughput_rps", "p50_ms", "p95_ms", "statuses")}
+            for name, route in report["routes"].items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    parser.add_argument("--routes", nargs="+", choices=list(load.ROUTES), default=["login", "get_post", "list_posts"])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--sample-size", type=int, default=200, help="seeded users to act as")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--output", help="write the JSON report to this file as well as stdout")
+    args = parser.parse_args()
+
+    results = {str(workers): measure(workers, args) for workers in sorted({1, args.workers})}
+    report = {
+        "cpus": cpu_count(),
+        "concurrency": args.concurrency,
+        "requests_per_route": args.requests,
+        "workers": results,
+    }
+    if args.workers > 1:
+        report["speedup"] = {
+            name: round(results[str(args.workers)][name]["throughput_rps"] / route["throughput_rps"], 2)
+            for name, route in results["1"].items() if route["throughput_rps"]
+        }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 from fastapi.testclient import TestClient
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 from app.models import Post
 from app.main import app
 from app.config import settings
 from app.database import get_db, Base
-from app.oauth2 import create_access_token
+from app.oauth2 import create_access_token, user_cache
+from app.cache import response_cache, create_backend
+from app.metrics import instrument_engine
+from app.limits import rate_limiter
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}_test"
 
@@ -14,10 +19,23 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The app runs on an AsyncSession. TestClient may drive each request on its own
+# event loop, so the async engine must not keep pooled connections between them
+ASYNC_SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+instrument_engine(async_engine.sync_engine)
+
 @pytest.fixture()
 def session():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    user_cache.clear()
+    response_cache.backend = create_backend(settings)
+    rate_limiter.store.clear()
 
     db = TestingSessionLocal()
     try:
@@ -25,10 +43,21 @@ def session():
     finally:
         db.close()
 
+@pytest.fixture()
+def statements():
+    # Records every SQL statement the app runs against the test database
+    executed = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
 @pytest.fixture()
 def client(session):
-    def override_get_db():
-        yield session
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
     app.dependency_overrides[get_db] = override_get_db   
     yield TestClient(app)
 
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import pytest
+from app import bulk, utils
+from app.config import settings
+from app.models import ImportCheckpoint, Post, User, UserStats, Vote
+from .conftest import async_engine
+
+ADMIN_KEY = "test-admin-key"
+
+@pytest.fixture
+def admin_client(client, monkeypatch):
+    monkeypatch.setattr(settings, "admin_api_key", ADMIN_KEY)
+    client.headers["X-Admin-Key"] = ADMIN_KEY
+    return client
+
+def upload(client, kind, filename, content):
+    return client.post(f"/admin/import/{kind}", files={"file": (filename, content)})
+
+def test_bulk_import_users_posts_votes(admin_client, session):
+    users_csv = "email,password\nbulk1@gmail.com,password123\nbulk2@gmail.com,password123\nbulk1@gmail.com,duplicate\n"
+    response = upload(admin_client, "users", "users.csv", users_csv)
+    assert response.status_code == 200
+    assert response.json()["read"] == 3
+    assert response.json()["inserted"] == 2
+
+    user = session.query(User).filter(User.email == "bulk1@gmail.com").one()
+    assert utils.verify("password123", user.password)
+
+    posts_ndjson = "\n".join(json.dumps(row) for row in [
+        {"title": "bulk post 1", "content": "content", "owner_email": "bulk1@gmail.com"},
+        {"title": "bulk post 2", "content": "content", "owner_id": user.id, "published": False},
+        {"title": "orphan", "content": "content", "owner_email": "nobody@gmail.com"},
+    ])
+    response = upload(admin_client, "posts", "posts.ndjson", posts_ndjson)
+    assert response.json()["inserted"] == 2
+
+    post_ids = [post.id for post in session.query(Post).order_by(Post.id)]
+    votes_csv = "user_email,user_id,post_id\n" + "".join([
+        f"bulk1@gmail.com,,{post_ids[0]}\n",
+        f"bulk2@gmail.com,,{post_ids[0]}\n",
+        f",{user.id},{post_ids[1]}\n",
+        f",{user.id},{post_ids[1]}\n",
+        f"bulk1@gmail.com,,999999\n",
+    ])
+    response = upload(admin_client, "votes", "votes.csv", votes_csv)
+    assert response.json()["inserted"] == 3
+
+    session.expire_all()
+    assert [post.vote_count for post in session.query(Post).order_by(Post.id)] == [2, 1]
+    assert session.query(Vote).count() == 3
+    stats = session.get(UserStats, user.id)
+    assert (stats.post_count, stats.votes_received) == (2, 3)
+
+def test_bulk_import_requires_admin_key(client, monkeypatch):
+    response = upload(client, "users", "users.csv", "email,password\n")
+    assert response.status_code == 403
+
+    monkeypatch.setattr(settings, "admin_api_key", ADMIN_KEY)
+    client.headers["X-Admin-Key"] = "wrong"
+    response = upload(client, "users", "users.csv", "email,password\n")
+    assert response.status_code == 403
+
+def test_bulk_import_rejects_malformed_row(admin_client, session, test_user):
+    posts_csv = "title,content,owner_id\n" + "".join([
+        f"post 1,content,{test_user['id']}\n",
+        f"post 2,content,{test_user['id']}\n",
+        "post 3,content,not-a-number\n",
+    ])
+    response = admin_client.post("/admin/import/posts", params={"batch_size": 2},
+                                 files={"file": ("posts.csv", posts_csv)})
+    assert response.status_code == 422
+    detail = response.json()["detail"]
+    assert (detail["row"], detail["committed_rows"]) == (3, 2)
+    assert detail["error"].startswith("owner_id:")
+    assert session.query(Post).count() == 2
+
+    response = upload(admin_client, "votes", "votes.ndjson", '{"user_id": 1, "post_id": 1}\n\n{"user_id": \n')
+    assert response.status_code == 422
+    assert response.json()["detail"]["row"] == 2
+
+    for batch_size in (0, -1):
+        response = admin_client.post("/admin/import/posts", params={"batch_size": batch_size},
+                                     files={"file": ("posts.csv", posts_csv)})
+        assert response.status_code == 422
+
+def test_bulk_import_resumes_from_checkpoint(session):
+    rows = [{"email": f"resume{i}@gmail.com", "password_hash": utils.hash("x") if i == 0 else "$2b$12$hash"} for i in range(5)]
+    checkpoint_name = "users"
+    key = {"kind": "users", "path": "users.csv", "batch_size": 2}
+
+    class Interrupted(Exception):
+        pass
+
+    def stop_after_first_batch(state):
+        raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        asyncio.run(bulk.import_rows(async_engine, "users", rows, batch_size=2,
+                                     checkpoint=bulk.Checkpoint(checkpoint_name, key), progress=stop_after_first_batch))
+    assert session.query(User).count() == 2
+    # Recorded in the transaction that committed the batch
+    assert session.get(ImportCheckpoint, "users").batches_done == 1
+
+    summary = asyncio.run(bulk.import_rows(async_engine, "users", rows, batch_size=2,
+                                           checkpoint=bulk.Checkpoint(checkpoint_name, key)))
+    assert summary["skipped_rows"] == 2
+    assert summary["inserted"] == 3
+    assert summary["batches"] == 3
+    assert session.query(User).count() == 5
@@ -0,0 +1,112 @@
+import asyncio
+import time
+import pytest
+from app.cache import TTLCache, MemoryBackend, RedisBackend, ResponseCache
+
+def test_cache_get_set():
+    cache = TTLCache(maxsize=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+def test_cache_expires_entries(monkeypatch):
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+def test_cache_pop():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.pop("a")
+    cache.pop("missing")
+    assert cache.get("a") is None
+
+class FakeRedis:
+    # Just the redis.asyncio commands RedisBackend uses
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+@pytest.fixture(params=["memory", "redis"])
+def response_cache(request):
+    if request.param == "memory":
+        return ResponseCache(MemoryBackend(maxsize=100, ttl=60))
+    return ResponseCache(RedisBackend(FakeRedis(), ttl=60))
+
+def test_response_cache_read_through(response_cache):
+    calls = []
+    async def compute():
+        calls.append(1)
+        return {"value": len(calls)}
+
+    async def run():
+        first = await response_cache.get_or_compute("a", compute, namespace="posts")
+        second = await response_cache.get_or_compute("a", compute, namespace="posts")
+        await response_cache.invalidate(namespaces=["posts"])
+        third = await response_cache.get_or_compute("a", compute, namespace="posts")
+        return first, second, third
+
+    assert asyncio.run(run()) == ({"value": 1}, {"value": 1}, {"value": 2})
+
+def test_response_cache_invalidate_key(response_cache):
+    values = iter([1, 2])
+    async def compute():
+        return next(values)
+
+    async def run():
+        await response_cache.get_or_compute("post:1", compute)
+        await response_cache.invalidate(keys=["post:1"])
+        return await response_cache.get_or_compute("post:1", compute)
+
+    assert asyncio.run(run()) == 2
+
+def test_response_cache_coalesces_misses(response_cache):
+    calls = []
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*(response_cache.get_or_compute("hot", compute) for _ in range(50)))
+
+    assert asyncio.run(run()) == ["value"] * 50
+    assert len(calls) == 1
+    assert response_cache.coalesced == 49
+
+def test_response_cache_shares_errors(response_cache):
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        return await asyncio.gather(*(response_cache.get_or_compute("bad", compute) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(run()))
@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from fastapi.testclient import TestClient
+from app import database, main
+from app.main import app, create_app
+from app.config import settings
+from app.database import ReplicaSet, engine_options, pool_stats
+from app.oauth2 import create_access_token
+from .conftest import ASYNC_SQLALCHEMY_DATABASE_URL
+
+def test_engine_options_from_settings():
+    tuned = settings.model_copy(update={"db_pool_size": 20, "db_max_overflow": 0, "db_pool_pre_ping": True})
+    options = engine_options(tuned)
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 0
+    assert options["pool_pre_ping"] is True
+    assert "connect_args" not in options
+
+def test_engine_options_pgbouncer_mode():
+    options = engine_options(settings.model_copy(update={"db_pgbouncer_mode": True}))
+    assert options["connect_args"]["statement_cache_size"] == 0
+    assert options["connect_args"]["prepared_statement_cache_size"] == 0
+
+def test_pool_stats_track_checkout_waits():
+    tuned = settings.model_copy(update={"db_pool_size": 1, "db_max_overflow": 0, "db_pool_timeout": 0.2})
+
+    async def run():
+        engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **engine_options(tuned))
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                busy = pool_stats(engine)
+                with pytest.raises(PoolTimeoutError):
+                    async with engine.connect():
+                        pass
+            return busy, pool_stats(engine)
+        finally:
+            await engine.dispose()
+
+    busy, idle = asyncio.run(run())
+    assert busy["checked_out"] == 1
+    assert busy["pool_size"] == 1
+    assert idle["checked_out"] == 0
+    assert idle["checkouts"] == 2
+    assert idle["checkout_timeouts"] == 1
+    assert idle["max_checkout_wait_ms"] >= 200
+
+def test_stats_report_pool(client):
+    response = client.get("/stats/")
+    assert response.status_code == 200
+    assert response.json()["db_pool"]["pool_size"] == settings.db_pool_size
+
+@pytest.fixture
+def replica(monkeypatch):
+    # The test database doubles as a replica, and reads sent to it are counted
+    replicas = ReplicaSet([ASYNC_SQLALCHEMY_DATABASE_URL], 60, {"poolclass": NullPool})
+    reads = []
+    event.listen(replicas.engines[0].sync_engine, "before_cursor_execute", lambda *args: reads.append(args[2]))
+    monkeypatch.setattr(database, "replicas", replicas)
+    monkeypatch.setattr(main, "replicas", replicas)
+    yield reads
+    asyncio.run(replicas.dispose())
+
+@pytest.fixture
+def replica_client(authorized_client, replica):
+    # An app created with replicas configured, so it tracks writers
+    replica_app = create_app()
+    replica_app.dependency_overrides = app.dependency_overrides
+    return TestClient(replica_app, headers=authorized_client.headers)
+
+def test_reads_go_to_replica(test_posts, replica_client, replica, statements):
+    response = replica_client.get(f"/posts/{test_posts[0].id}")
+    assert response.status_code == 200
+    assert len(replica) > 0
+    assert statements == []
+    assert database.replicas.stats()["replica_reads"] == 1
+
+def test_writers_read_from_primary(test_user2, test_posts, replica_client, replica, statements):
+    response = replica_client.post("/posts/", json={"title": "fresh", "content": "content"})
+    assert response.status_code == 201
+    replica.clear()
+
+    response = replica_client.get(f"/posts/{response.json()['id']}")
+    assert response.status_code == 200
+    assert replica == []
+    assert database.replicas.stats()["sticky_reads"] == 1
+
+    # Other users still read from the replica
+    token = create_access_token({"user_id": test_user2["id"]})
+    response = replica_client.get("/posts/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert len(replica) > 0
+
+def test_unhealthy_replica_falls_back_to_primary(authorized_client, test_posts, monkeypatch):
+    url = ASYNC_SQLALCHEMY_DATABASE_URL
+    down = url.replace(f":{settings.database_port}/", ":1/")
+    replicas = ReplicaSet([url, down], 60, {"poolclass": NullPool})
+    monkeypatch.setattr(database, "replicas", replicas)
+    asyncio.run(replicas.check())
+    assert replicas.healthy == [True, False]
+    assert [replicas.choose() for _ in range(3)] == [0, 0, 0]
+
+    replicas.healthy[0] = False
+    assert replicas.choose() is None
+    response = authorized_client.get("/posts/")
+    assert response.status_code == 200
+    assert replicas.stats()["primary_reads"] == 2
+    asyncio.run(replicas.dispose())
+
+def test_replicas_round_robin():
+    replicas = ReplicaSet([ASYNC_SQLALCHEMY_DATABASE_URL] * 2, 60, {"poolclass": NullPool})
+    assert [replicas.choose() for _ in range(4)] == [0, 1, 0, 1]
+    replicas.mark_write(7)
+    assert replicas.choose(7) is None
+    assert replicas.choose(8) == 0
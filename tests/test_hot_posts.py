@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from app.models import Post, PostRanking
+from app.ranking import refresh_hot_posts, take_refresh_lock
+from .conftest import TestingAsyncSessionLocal, async_engine
+
+def refresh():
+    async def run():
+        async with TestingAsyncSessionLocal() as db:
+            await refresh_hot_posts(db)
+    asyncio.run(run())
+
+def test_hot_posts_ranked_by_decayed_votes(authorized_client, session, test_posts):
+    # An older post needs more votes to outrank a fresh one
+    old = session.get(Post, test_posts[0].id)
+    old.created_at = datetime.now(timezone.utc) - timedelta(hours=30)
+    old.vote_count = 5
+    session.get(Post, test_posts[1].id).vote_count = 1
+    session.get(Post, test_posts[2].id).vote_count = 2
+    session.commit()
+    refresh()
+
+    response = authorized_client.get("/posts/hot", params={"limit": 3})
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()] == [test_posts[2].id, test_posts[1].id, test_posts[0].id]
+    assert response.json()[0]["votes"] == 2
+
+def test_hot_posts_drop_posts_past_horizon(authorized_client, session, test_posts):
+    refresh()
+    assert session.query(PostRanking).count() == len(test_posts)
+
+    old = session.get(Post, test_posts[0].id)
+    old.created_at = datetime.now(timezone.utc) - timedelta(days=30)
+    session.commit()
+    refresh()
+
+    assert session.query(PostRanking).count() == len(test_posts) - 1
+    ids = [post["id"] for post in authorized_client.get("/posts/hot").json()]
+    assert test_posts[0].id not in ids
+
+def test_hot_posts_refresh_invalidates_cache(authorized_client, session, test_posts):
+    refresh()
+    assert authorized_client.get("/posts/hot", params={"limit": 1}).json()[0]["votes"] == 0
+
+    session.get(Post, test_posts[3].id).vote_count = 9
+    session.commit()
+    refresh()
+    top = authorized_client.get("/posts/hot", params={"limit": 1}).json()[0]
+    assert top["id"] == test_posts[3].id
+
+def test_hot_posts_limit_is_bounded(authorized_client):
+    assert authorized_client.get("/posts/hot", params={"limit": 0}).status_code == 422
+    assert authorized_client.get("/posts/hot", params={"limit": 10000}).status_code == 422
+
+def test_hot_posts_unauthorized(client):
+    assert client.get("/posts/hot").status_code == 401
+
+def test_one_process_holds_refresh_lock(session):
+    # Each worker's run_refresh tries the lock; only its holder refreshes
+    async def run():
+        async with async_engine.connect() as first, async_engine.connect() as second:
+            assert await take_refresh_lock(first)
+            assert not await take_refresh_lock(second)
+            await first.close()
+            assert await take_refresh_lock(second)
+    asyncio.run(run())
@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+from app import limits
+from app.limits import AdmissionController, MemoryRateLimitStore, RateLimiter
+from app.oauth2 import create_access_token
+
+def test_admission_queues_then_rejects():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+
+    async def run():
+        assert await controller.acquire()
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        # The queue is full
+        assert not await controller.acquire()
+        # Releasing hands the slot to the queued request
+        controller.release()
+        assert await queued
+        controller.release()
+
+    asyncio.run(run())
+    assert controller.stats() | {"in_flight": 0, "admitted": 2, "queued": 1, "rejected": 1, "timed_out": 0} == controller.stats()
+
+def test_admission_queue_times_out():
+    controller = AdmissionController(max_in_flight=1, max_queue=5, queue_timeout=0.01)
+
+    async def run():
+        assert await controller.acquire()
+        assert not await controller.acquire()
+
+    asyncio.run(run())
+    assert controller.stats()["timed_out"] == 1
+    assert controller.stats()["waiting"] == 0
+
+def test_admission_timeout_races_release(monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_queue=5, queue_timeout=1)
+
+    async def timed_out(waiter, timeout):
+        # A slot frees while wait_for is cancelling the timed out waiter
+        waiter.cancel()
+        controller.release()
+        raise asyncio.TimeoutError
+
+    async def run():
+        assert await controller.acquire()
+        monkeypatch.setattr(asyncio, "wait_for", timed_out)
+        assert not await controller.acquire()
+
+    asyncio.run(run())
+    assert controller.stats() | {"in_flight": 0, "waiting": 0, "timed_out": 1} == controller.stats()
+
+def test_admission_timeout_after_handover(monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_queue=5, queue_timeout=1)
+
+    async def timed_out(waiter, timeout):
+        # As asyncio.timeout does on Python 3.12+: the slot is handed over,
+        # yet the wait still ends in TimeoutError
+        controller.release()
+        raise asyncio.TimeoutError
+
+    async def run():
+        assert await controller.acquire()
+        monkeypatch.setattr(asyncio, "wait_for", timed_out)
+        assert not await controller.acquire()
+
+    asyncio.run(run())
+    assert controller.stats() | {"in_flight": 0, "waiting": 0, "timed_out": 1} == controller.stats()
+
+def test_overloaded_server_sheds_requests(client, monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+    controller.in_flight = 1
+    monkeypatch.setattr(limits, "admission", controller)
+
+    response = client.get("/", headers={"Origin": "https://example.com"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    # Browsers can read the rejection
+    assert response.headers["Access-Control-Allow-Origin"] == "*"
+
+    # Monitoring stays reachable
+    response = client.get("/stats/")
+    assert response.status_code == 200
+    assert response.json()["admission"]["rejected"] == 1
+
+def test_login_rate_limited(client, test_user, monkeypatch):
+    monkeypatch.setattr(limits, "rate_limiter", RateLimiter({"POST /login": "3/minute"}, MemoryRateLimitStore()))
+    credentials = {"username": test_user["email"], "password": "wrong"}
+    for _ in range(3):
+        assert client.post("/login", data=credentials).status_code == 403
+    response = client.post("/login", data=credentials)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+def test_rate_limits_are_per_user(client, test_user, test_user2, monkeypatch):
+    monkeypatch.setattr(limits, "rate_limiter", RateLimiter({"GET /users/{id}": "2/minute"}, MemoryRateLimitStore()))
+    first = {"Authorization": f"Bearer {create_access_token({'user_id': test_user['id']})}"}
+    second = {"Authorization": f"Bearer {create_access_token({'user_id': test_user2['id']})}"}
+
+    assert [client.get(f"/users/{test_user['id']}", headers=first).status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get(f"/users/{test_user['id']}", headers=second).status_code == 200
+    assert limits.rate_limiter.stats() == {"routes": 1, "allowed": 3, "limited": 1}
+
+def test_token_bucket_refills():
+    store = MemoryRateLimitStore()
+
+    async def run():
+        assert await store.take("key", 1, 100) == 0
+        wait = await store.take("key", 1, 100)
+        assert 0 < wait <= 0.01
+        await asyncio.sleep(wait + 0.005)
+        return await store.take("key", 1, 100)
+
+    assert asyncio.run(run()) == 0
+
+def test_parse_rate():
+    assert limits.parse_rate("10/minute") == (10, 10 / 60)
+    with pytest.raises(KeyError):
+        limits.parse_rate("10/fortnight")
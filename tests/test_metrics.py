@@ -0,0 +1,27 @@
+import re
+
+def test_server_timing_header(authorized_client, test_posts):
+    authorized_client.get("/posts/")
+    response = authorized_client.get(f"/posts/{test_posts[0].id}")
+    timing = response.headers["Server-Timing"]
+    assert re.match(r'app;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries"', timing)
+
+def test_metrics_endpoint(authorized_client, test_posts):
+    authorized_client.get(f"/posts/{test_posts[0].id}")
+    authorized_client.get("/posts/999999")
+
+    response = authorized_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/posts/{id}",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="/posts/{id}",status="404"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/posts/{id}",le="+Inf"}' in body
+    assert 'http_request_db_statements_total{method="GET",route="/posts/{id}"}' in body
+    assert "http_requests_in_flight 1" in body
+    assert "db_pool_checked_out" in body
+    assert "user_cache_hits" in body
+
+def test_metrics_unmatched_route(client):
+    client.get("/no/such/route")
+    assert 'route="unmatched",status="404"' in client.get("/metrics").text
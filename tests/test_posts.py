@@ -1,4 +1,10 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
 from app.schemes import PostWithVotes, Post, UserOut
+from app.config import settings
+from app import conditional, models
 import pytest
 
 # Helper function to find a post owned by a specific user ID
@@ -22,6 +28,157 @@ def test_get_all_posts(authorized_client, test_posts):
     response_post_ids = {p.id for p in posts_from_api}
     assert original_post_ids == response_post_ids
 
+def test_get_posts_cursor_pagination(authorized_client, test_posts):
+    seen_ids = []
+    response = authorized_client.get("/posts/?limit=3")
+    while True:
+        assert response.status_code == 200
+        seen_ids.extend(p["id"] for p in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = authorized_client.get("/posts/", params={"limit": 3, "cursor": cursor})
+
+    # Newest first, with id breaking ties between posts created together
+    assert seen_ids == sorted((p.id for p in test_posts), reverse=True)
+
+def test_get_posts_limit_is_bounded(authorized_client, test_posts):
+    # The look-ahead row needs a page of at least one post
+    assert authorized_client.get("/posts/", params={"limit": 0}).status_code == 422
+    assert authorized_client.get("/posts/", params={"limit": 10000}).status_code == 422
+    assert authorized_client.get("/posts/", params={"skip": -1}).status_code == 422
+
+def test_get_posts_offset_matches_cursor(authorized_client, test_posts):
+    first_page = authorized_client.get("/posts/?limit=2")
+    by_cursor = authorized_client.get("/posts/", params={"limit": 2, "cursor": first_page.headers["X-Next-Cursor"]})
+    by_offset = authorized_client.get("/posts/?limit=2&skip=2")
+    assert [p["id"] for p in by_cursor.json()] == [p["id"] for p in by_offset.json()]
+    assert "X-Next-Cursor" not in by_offset.headers
+
+def test_get_posts_invalid_cursor(authorized_client, test_posts):
+    response = authorized_client.get("/posts/?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+def test_get_posts_substring_search(authorized_client, test_posts):
+    response = authorized_client.get("/posts/", params={"search": "second"})
+    assert {p["title"] for p in response.json()} == {"second title user1", "second title user2"}
+
+    # Content is searched as well as the title
+    response = authorized_client.get("/posts/", params={"search": "content user2"})
+    assert len(response.json()) == 2
+
+def test_get_posts_fulltext_search(authorized_client, test_posts):
+    response = authorized_client.get("/posts/", params={"search": "first user1", "search_mode": "fulltext"})
+    assert response.status_code == 200
+    assert [p["title"] for p in response.json()] == ["first title user1"]
+
+def test_get_posts_fulltext_search_rejects_cursor(authorized_client, test_posts):
+    first_page = authorized_client.get("/posts/?limit=1")
+    response = authorized_client.get("/posts/", params={"search": "title", "search_mode": "fulltext", "cursor": first_page.headers["X-Next-Cursor"]})
+    assert response.status_code == 400
+
+def test_get_posts_statement_count_constant(authorized_client, session, test_posts, statements):
+    owners = [models.User(email=f"owner{i}@gmail.com", password="password123") for i in range(10)]
+    session.add_all(owners)
+    session.commit()
+    session.add_all([models.Post(title=f"title {i}", content="content", owner_id=owner.id) for i, owner in enumerate(owners)])
+    session.commit()
+
+    counts = []
+    for limit in (1, 5, 14):
+        authorized_client.get("/posts/")
+        statements.clear()
+        response = authorized_client.get(f"/posts/?limit={limit}")
+        assert len({p["owner"]["id"] for p in response.json()}) == min(limit, 12)
+        counts.append(len(statements))
+    assert counts == [1, 1, 1]
+
+def test_get_posts_served_from_cache(authorized_client, test_posts, statements):
+    first = authorized_client.get("/posts/?limit=2")
+    statements.clear()
+    second = authorized_client.get("/posts/?limit=2")
+    assert second.json() == first.json()
+    assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+    assert statements == []
+
+def test_cached_post_reads_match_schema(authorized_client, test_posts):
+    # Cached pages are sent as stored JSON text, bypassing response_model
+    first = authorized_client.get(f"/posts/{test_posts[0].id}")
+    second = authorized_client.get(f"/posts/{test_posts[0].id}")
+    assert first.headers["content-type"] == "application/json"
+    assert second.content == first.content
+    assert PostWithVotes(**first.json()).model_dump(mode="json") == first.json()
+
+    page = authorized_client.get("/posts/").json()
+    assert [PostWithVotes(**post).model_dump(mode="json") for post in page] == page
+
+def test_get_post_conditional(authorized_client, test_posts, statements):
+    url = f"/posts/{test_posts[0].id}"
+    response = authorized_client.get(url)
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+
+    # A matching ETag costs one version lookup and no body
+    statements.clear()
+    response = authorized_client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert len(statements) == 1
+
+    response = authorized_client.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    # A vote changes the post, and so its version
+    authorized_client.post("/vote/", json={"post_id": test_posts[0].id, "dir": 1})
+    response = authorized_client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["votes"] == 1
+    assert response.headers["ETag"] != etag
+
+def test_get_posts_conditional(authorized_client, test_posts):
+    response = authorized_client.get("/posts/", params={"limit": 2})
+    etag = response.headers["ETag"]
+
+    response = authorized_client.get("/posts/", params={"limit": 2}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # A change to any post on the page gives the page a new ETag
+    post_id = authorized_client.get("/posts/", params={"limit": 2}).json()[1]["id"]
+    authorized_client.post("/vote/", json={"post_id": post_id, "dir": 1})
+    response = authorized_client.get("/posts/", params={"limit": 2}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.headers["X-Next-Cursor"]
+
+def test_get_posts_ignores_if_modified_since(authorized_client, test_posts):
+    newest = authorized_client.post("/posts/", json={"title": "newest", "content": "content"}).json()["id"]
+    response = authorized_client.get("/posts/", params={"limit": 2})
+    assert response.json()[0]["id"] == newest
+    assert "Last-Modified" not in response.headers
+
+    # Deleting the newest post pulls an older, unchanged one onto the page
+    since = conditional.http_date(datetime.now(timezone.utc))
+    assert authorized_client.delete(f"/posts/{newest}").status_code == 204
+    response = authorized_client.get("/posts/", params={"limit": 2}, headers={"If-Modified-Since": since})
+    assert response.status_code == 200
+    assert newest not in [p["id"] for p in response.json()]
+
+def test_post_cache_invalidated_by_writes(authorized_client, test_posts):
+    post_id = test_posts[0].id
+    assert authorized_client.get(f"/posts/{post_id}").json()["votes"] == 0
+    assert authorized_client.get("/posts/").json()[-1]["votes"] == 0
+
+    authorized_client.post("/vote/", json={"post_id": post_id, "dir": 1})
+    assert authorized_client.get(f"/posts/{post_id}").json()["votes"] == 1
+    assert authorized_client.get("/posts/").json()[-1]["votes"] == 1
+
+    authorized_client.put(f"/posts/{post_id}", json={"title": "changed", "content": "changed"})
+    assert authorized_client.get(f"/posts/{post_id}").json()["title"] == "changed"
+
+    authorized_client.delete(f"/posts/{post_id}")
+    assert authorized_client.get(f"/posts/{post_id}").status_code == 404
+    assert len(authorized_client.get("/posts/").json()) == len(test_posts) - 1
+
 def test_unauthorized_user_get_all_posts(client, test_posts):
     response = client.get("/posts/")
     assert response.status_code == 401
@@ -163,27 +320,40 @@ def test_delete_other_user_post(authorized_client, test_user, test_user2, test_p
     response = authorized_client.delete(f"/posts/{other_user_post.id}")
     assert response.status_code == 403 
 
+def test_writes_are_single_statements(authorized_client, test_user, test_posts, statements):
+    user_post = find_post_by_owner(test_posts, test_user['id'])
+    authorized_client.get("/posts/")
 
+    statements.clear()
+    authorized_client.post("/posts/", json={"title": "new", "content": "new"})
+    authorized_client.put(f"/posts/{user_post.id}", json={"title": "updated", "content": "updated"})
+    authorized_client.post("/vote/", json={"post_id": user_post.id, "dir": 1})
+    authorized_client.post("/vote/", json={"post_id": user_post.id, "dir": 0})
+    authorized_client.delete(f"/posts/{user_post.id}")
+    assert len(statements) == 5
 
+# --- Test Exporting Posts ---
 
+def test_export_posts_ndjson(authorized_client, test_posts):
+    response = authorized_client.get("/posts/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == sorted((p.id for p in test_posts), reverse=True)
+    assert set(rows[0]) == {"id", "title", "content", "published", "created_at", "owner_id", "owner_email", "votes"}
 
+def test_export_posts_csv_with_search(authorized_client, test_posts):
+    response = authorized_client.get("/posts/export", params={"format": "csv", "search": "user2"})
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["id", "title", "content", "published", "created_at", "owner_id", "owner_email", "votes"]
+    assert {row[1] for row in rows[1:]} == {"first title user2", "second title user2"}
 
+def test_export_posts_streams_in_batches(authorized_client, test_posts, monkeypatch):
+    monkeypatch.setattr(settings, "export_batch_size", 1)
+    response = authorized_client.get("/posts/export")
+    assert len(response.text.splitlines()) == len(test_posts)
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+def test_unauthorized_user_export_posts(client, test_posts):
+    response = client.get("/posts/export")
+    assert response.status_code == 401
@@ -0,0 +1,122 @@
+import json
+import os
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from app.database import Base
+from .conftest import engine
+
+# Every statement a route issues is planned with EXPLAIN against the test
+# database, with sequential scans disabled. The planner then picks an index
+# wherever one applies, so a Seq Scan left in a plan means no index can serve it
+
+TABLES = set(Base.metadata.tables)
+
+def next_cursor(client):
+    return client.get("/posts/", params={"limit": 1}).headers["X-Next-Cursor"]
+
+ROUTES = {
+    "list_posts": lambda client, posts: client.get("/posts/"),
+    "list_posts_offset": lambda client, posts: client.get("/posts/", params={"skip": 2}),
+    "list_posts_cursor": lambda client, posts: client.get("/posts/", params={"limit": 1, "cursor": next_cursor(client)}),
+    "hot_posts": lambda client, posts: client.get("/posts/hot"),
+    "get_post": lambda client, posts: client.get(f"/posts/{posts[0].id}"),
+    "export_posts": lambda client, posts: client.get("/posts/export"),
+    "create_post": lambda client, posts: client.post("/posts/", json={"title": "title", "content": "content"}),
+    "update_post": lambda client, posts: client.put(f"/posts/{posts[0].id}", json={"title": "title", "content": "content"}),
+    "delete_post": lambda client, posts: client.delete(f"/posts/{posts[0].id}"),
+    "vote": lambda client, posts: client.post("/vote/", json={"post_id": posts[1].id, "dir": 1}),
+    "unvote": lambda client, posts: client.post("/vote/", json={"post_id": posts[0].id, "dir": 0}),
+    "vote_batch": lambda client, posts: client.post("/vote/batch", json=[{"post_id": post.id, "dir": 1} for post in posts]),
+    "create_user": lambda client, posts: client.post("/users/", json={"email": "plans@gmail.com", "password": "password123"}),
+    "get_user": lambda client, posts: client.get(f"/users/{posts[0].owner_id}"),
+    "get_user_stats": lambda client, posts: client.get(f"/users/{posts[0].owner_id}/stats"),
+    "login": lambda client, posts: client.post("/login", data={"username": "hello1237@gmail.com", "password": "password123"}),
+}
+
+# Served by the indexes of the add_posts_search_indexes migration
+SEARCH_ROUTES = {
+    "substring_search": lambda client, posts: client.get("/posts/", params={"search": "first"}),
+    "fulltext_search": lambda client, posts: client.get("/posts/", params={"search": "first", "search_mode": "fulltext"}),
+    "export_search": lambda client, posts: client.get("/posts/export", params={"search": "first"}),
+}
+
+def explain(statement: str) -> dict:
+    # GENERIC_PLAN (Postgres 16+) plans the statement with its $n placeholders
+    # unbound. psycopg2 sends it as is when given no parameters
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN (GENERIC_PLAN, FORMAT JSON) {statement}")
+        plan = cursor.fetchone()[0]
+        return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    finally:
+        connection.rollback()
+        connection.close()
+
+def seq_scans(plan: dict):
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in TABLES:
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+def assert_no_seq_scans(statements):
+    planned = [s for s in statements if s.lstrip().split(None, 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")]
+    assert planned
+    for statement in planned:
+        scanned = list(seq_scans(explain(statement)))
+        assert not scanned, f"sequential scan on {', '.join(scanned)}:\n{statement}"
+
+@pytest.fixture
+def search_indexes(session):
+    # Built by their migration, as in production, in place of the ones
+    # create_all made. The trigram index needs pg_trgm
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar() is None:
+            pytest.skip("pg_trgm is not available")
+    config = Config(os.path.join(os.path.dirname(__file__), "..", "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(os.path.dirname(__file__), "..", "alembic"))
+    revision = ScriptDirectory.from_config(config).get_revision("3fe9494de0b4")
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_posts_search_fulltext, ix_posts_search_trigram"))
+        with Operations.context(MigrationContext.configure(conn)):
+            revision.module.upgrade()
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_route_queries_use_indexes(route, authorized_client, test_posts, test_vote, statements):
+    statements.clear()
+    response = ROUTES[route](authorized_client, test_posts)
+    assert response.status_code < 400
+    assert_no_seq_scans(statements)
+
+@pytest.mark.parametrize("route", SEARCH_ROUTES)
+def test_search_queries_use_indexes(route, authorized_client, test_posts, search_indexes, statements):
+    statements.clear()
+    response = SEARCH_ROUTES[route](authorized_client, test_posts)
+    assert response.status_code < 400
+    assert_no_seq_scans(statements)
+
+def test_foreign_keys_are_indexed(session):
+    # A foreign key without an index on its columns makes every delete of the
+    # referenced row scan the referencing table
+    unindexed = session.execute(text("""
+        SELECT c.conrelid::regclass::text, c.conname
+        FROM pg_constraint c
+        WHERE c.contype = 'f' AND NOT EXISTS (
+            SELECT 1 FROM pg_index i
+            WHERE i.indrelid = c.conrelid
+              AND (i.indkey::int2[])[0:cardinality(c.conkey) - 1] @> c.conkey
+        )
+    """)).all()
+    assert unindexed == []
+
+def test_search_indexes_are_in_metadata(search_indexes):
+    # Otherwise autogenerate would drop the indexes the migration created
+    with engine.connect() as conn:
+        diff = compare_metadata(MigrationContext.configure(conn), Base.metadata)
+    assert [change for change in diff if change[0] in ("add_index", "remove_index")] == []
@@ -0,0 +1,52 @@
+import pytest
+from app.config import settings
+from app.server import Server, cgroup_cpu_limit, check_workers, cpu_count, server_options
+
+def test_server_options(monkeypatch):
+    monkeypatch.setattr(settings, "server_workers", 0)
+    server = Server(server_options(settings))
+    # One worker per CPU by default, forked from a preloaded app
+    assert server.cfg.workers == cpu_count()
+    assert server.cfg.preload_app
+    assert server.cfg.worker_class_str == "uvicorn_worker.UvicornWorker"
+    assert server.cfg.max_requests == settings.server_max_requests
+    assert server.cfg.graceful_timeout == settings.server_graceful_timeout_seconds
+
+    monkeypatch.setattr(settings, "server_workers", 3)
+    assert Server(server_options(settings)).cfg.workers == 3
+
+def test_several_workers_with_per_process_backends(monkeypatch):
+    monkeypatch.setattr(settings, "server_workers", 0)
+    monkeypatch.setattr(settings, "response_cache_backend", "memory")
+    monkeypatch.setattr(settings, "rate_limits", {})
+    # Still one worker per CPU by default
+    assert server_options(settings)["workers"] == cpu_count()
+    check_workers(settings, 1)
+    assert settings.response_cache_backend == "memory"
+
+    # Each worker would keep its own cache, so it is turned off
+    check_workers(settings, 2)
+    assert settings.response_cache_backend == "none"
+
+    # Each worker would allow the full limit
+    monkeypatch.setattr(settings, "rate_limits", {"POST /login": "10/minute"})
+    monkeypatch.setattr(settings, "rate_limit_backend", "memory")
+    with pytest.raises(SystemExit, match="rate limits"):
+        check_workers(settings, 2)
+    monkeypatch.setattr(settings, "rate_limit_backend", "redis")
+    check_workers(settings, 2)
+
+def test_cgroup_cpu_limit(tmp_path):
+    assert cgroup_cpu_limit(str(tmp_path)) is None
+    # cgroup v1: a quota of 1.5 CPUs rounds up
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("150000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert cgroup_cpu_limit(str(tmp_path)) == 2
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("-1\n")
+    assert cgroup_cpu_limit(str(tmp_path)) is None
+    # cgroup v2
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert cgroup_cpu_limit(str(tmp_path)) is None
+    (tmp_path / "cpu.max").write_text("300000 100000\n")
+    assert cgroup_cpu_limit(str(tmp_path)) == 3
@@ -1,7 +1,14 @@
+import asyncio
 import pytest
+from datetime import datetime, timezone
 from jose import jwt
 from app.schemes import UserOut, Token
 from app.config import settings
+from app import utils
+from app.oauth2 import user_cache
+from app.models import Post, Vote
+from app.user_stats import rebuild_user_stats
+from .conftest import TestingAsyncSessionLocal
 
 def test_create_user(client):
     response = client.post("/users/", json={"email":"hello1237@gmail.com", "password":"password123"})
@@ -9,6 +16,11 @@ def test_create_user(client):
     assert new_user.email == "hello1237@gmail.com"
     assert response.status_code == 201    
 
+def test_create_user_duplicate_email(client, test_user):
+    response = client.post("/users/", json={"email":test_user["email"], "password":"password123"})
+    assert response.status_code == 400
+    assert response.json().get("detail") == "User with this email already exists"
+
 def test_login_user(client, test_user):
     response = client.post("/login", data={"username":test_user["email"], "password":test_user["password"]})
     login_data = Token(**response.json())
@@ -27,3 +39,96 @@ def test_incorrect_login(client, test_user, email, password, status_code):
     response = client.post("/login", data={"username":email, "password":password})
     assert response.status_code == status_code
     assert response.json().get("detail") == "Invalid Credentials"
+
+def test_create_user_hashing_overloaded(client, monkeypatch):
+    monkeypatch.setattr(utils.hasher, "in_flight", utils.hasher.workers + utils.hasher.queue_size)
+    response = client.post("/users/", json={"email":"hello1237@gmail.com", "password":"password123"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+def test_hashing_stats(client, test_user):
+    response = client.post("/login", data={"username":test_user["email"], "password":test_user["password"]})
+    assert response.status_code == 200
+    stats = client.get("/stats/").json()["password_hashing"]
+    assert stats["completed"] >= 2
+    assert stats["in_flight"] == 0
+
+def test_current_user_is_cached(authorized_client, test_user):
+    authorized_client.get("/posts/")
+    misses = user_cache.stats()["misses"]
+    for _ in range(3):
+        assert authorized_client.get("/posts/").status_code == 200
+    assert user_cache.stats()["misses"] == misses
+    assert user_cache.get(test_user["id"]).email == test_user["email"]
+
+def test_create_user_invalidates_cached_user(client):
+    # A stale entry under the id the new user gets, e.g. after a restore
+    user_cache.set(1, UserOut(id=1, email="stale@example.com", created_at=datetime.now(timezone.utc)))
+    response = client.post("/users/", json={"email": "fresh@example.com", "password": "password123"})
+    assert response.json()["id"] == 1
+    assert user_cache.get(1) is None
+
+def test_get_user_conditional(client, test_user):
+    response = client.get(f"/users/{test_user['id']}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+
+    response = client.get(f"/users/{test_user['id']}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    response = client.get(f"/users/{test_user['id']}", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+
+def test_get_user_if_modified_since_without_zone(client, test_user):
+    # "-0000" parses to a naive datetime
+    url = f"/users/{test_user['id']}"
+    assert client.get(url, headers={"If-Modified-Since": "Wed, 21 Oct 2099 07:28:00 -0000"}).status_code == 304
+    assert client.get(url, headers={"If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 -0000"}).status_code == 200
+
+def test_user_stats_follow_posts_and_votes(authorized_client, test_user):
+    response = authorized_client.get(f"/users/{test_user['id']}/stats")
+    assert response.json() == {"user_id": test_user["id"], "post_count": 0, "votes_received": 0, "last_post_at": None}
+
+    first = authorized_client.post("/posts/", json={"title": "first", "content": "content"}).json()
+    second = authorized_client.post("/posts/", json={"title": "second", "content": "content"}).json()
+    authorized_client.post("/vote/", json={"post_id": first["id"], "dir": 1})
+    stats = authorized_client.get(f"/users/{test_user['id']}/stats").json()
+    assert stats["post_count"] == 2
+    assert stats["votes_received"] == 1
+
+    authorized_client.post("/vote/", json={"post_id": first["id"], "dir": 0})
+    assert authorized_client.get(f"/users/{test_user['id']}/stats").json()["votes_received"] == 0
+
+    authorized_client.post("/vote/", json={"post_id": second["id"], "dir": 1})
+    assert authorized_client.delete(f"/posts/{second['id']}").status_code == 204
+    stats = authorized_client.get(f"/users/{test_user['id']}/stats").json()
+    assert stats["post_count"] == 1
+    assert stats["votes_received"] == 0
+    assert stats["last_post_at"] == first["created_at"]
+
+def test_user_stats_not_found(client):
+    assert client.get("/users/999999/stats").status_code == 404
+
+def test_user_stats_single_statement(client, test_user, statements):
+    statements.clear()
+    assert client.get(f"/users/{test_user['id']}/stats").status_code == 200
+    assert len(statements) == 1
+
+def test_rebuild_user_stats(client, session, test_user, test_posts):
+    # The fixtures write through the ORM, past the maintained counters. Votes
+    # are counted from the votes table, not from a drifted vote_count
+    session.add(Vote(user_id=test_user['id'], post_id=test_posts[0].id))
+    session.query(Post).filter(Post.id == test_posts[0].id).update({Post.vote_count: 3})
+    session.commit()
+
+    async def rebuild():
+        async with TestingAsyncSessionLocal() as db:
+            return await rebuild_user_stats(db)
+
+    assert asyncio.run(rebuild()) == 2
+    stats = client.get(f"/users/{test_user['id']}/stats").json()
+    assert stats["post_count"] == 2
+    assert stats["votes_received"] == 1
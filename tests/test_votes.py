@@ -1,3 +1,15 @@
+import asyncio
+import httpx
+import pytest
+from app.main import app
+from app.models import Post, User, UserStats, Vote
+from app.oauth2 import create_access_token
+from app.commands import repair_vote_counts
+from app.config import settings
+from app.routers import vote as vote_router
+from app.votes import VoteBuffer
+from .conftest import TestingAsyncSessionLocal
+
 def test_vote_on_post(authorized_client, test_posts):
     response = authorized_client.post("/vote/", json={"post_id":test_posts[0].id, "dir":1})
     assert response.status_code == 201
@@ -36,17 +48,149 @@ def test_delete_vote_unauthorized(client, test_posts):
     response = client.post("/vote/", json={"post_id":test_posts[0].id, "dir":0})
     assert response.status_code == 401
 
+def test_vote_updates_post_vote_count(authorized_client, test_posts):
+    post_id = test_posts[0].id
+    authorized_client.post("/vote/", json={"post_id":post_id, "dir":1})
+    assert authorized_client.get(f"/posts/{post_id}").json()["votes"] == 1
+
+    authorized_client.post("/vote/", json={"post_id":post_id, "dir":0})
+    assert authorized_client.get(f"/posts/{post_id}").json()["votes"] == 0
+
+def test_vote_count_consistent_under_concurrent_votes(client, session, test_posts):
+    voters = [User(email=f"voter{i}@gmail.com", password="password123") for i in range(15)]
+    session.add_all(voters)
+    session.commit()
+    post_id = test_posts[0].id
+
+    async def cast_votes():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            requests = []
+            for voter in voters:
+                headers = {"Authorization": f"Bearer {create_access_token({'user_id': voter.id})}"}
+                # Each voter races a duplicate vote against itself, and a third of them unvote
+                requests.append(async_client.post("/vote/", json={"post_id":post_id, "dir":1}, headers=headers))
+                requests.append(async_client.post("/vote/", json={"post_id":post_id, "dir":1}, headers=headers))
+                if voter.id % 3 == 0:
+                    requests.append(async_client.post("/vote/", json={"post_id":post_id, "dir":0}, headers=headers))
+            return await asyncio.gather(*requests)
+
+    responses = asyncio.run(cast_votes())
+    assert all(response.status_code in (201, 404, 409) for response in responses)
+
+    session.expire_all()
+    vote_rows = session.query(Vote).filter(Vote.post_id == post_id).count()
+    assert session.get(Post, post_id).vote_count == vote_rows
+
+def test_repair_vote_counts(authorized_client, session, test_posts):
+    authorized_client.post("/vote/", json={"post_id":test_posts[0].id, "dir":1})
+    session.query(Post).update({Post.vote_count: 7})
+    owners = {post.owner_id for post in test_posts}
+    session.add_all([UserStats(user_id=owner, post_count=2, votes_received=14) for owner in owners])
+    session.commit()
+
+    async def repair():
+        async with TestingAsyncSessionLocal() as db:
+            return await repair_vote_counts(db)
+
+    assert asyncio.run(repair()) == len(test_posts)
+    session.expire_all()
+    assert session.get(Post, test_posts[0].id).vote_count == 1
+    assert session.get(Post, test_posts[1].id).vote_count == 0
+    # user_stats drifted along with vote_count and is rebuilt from the votes
+    assert {owner: session.get(UserStats, owner).votes_received for owner in owners} == {
+        test_posts[0].owner_id: 1, test_posts[2].owner_id: 0}
+
+def test_vote_batch(authorized_client, session, test_posts):
+    authorized_client.post("/vote/", json={"post_id":test_posts[1].id, "dir":1})
+    response = authorized_client.post("/vote/batch", json=[
+        {"post_id":test_posts[0].id, "dir":1},
+        {"post_id":test_posts[1].id, "dir":1},
+        {"post_id":test_posts[2].id, "dir":0},
+        {"post_id":999999, "dir":1},
+    ])
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()] == ["added", "already_voted", "not_voted", "post_not_found"]
+
+    response = authorized_client.post("/vote/batch", json=[
+        {"post_id":test_posts[0].id, "dir":0},
+        {"post_id":test_posts[1].id, "dir":0},
+    ])
+    assert [r["status"] for r in response.json()] == ["deleted", "deleted"]
+
+    session.expire_all()
+    assert all(post.vote_count == 0 for post in session.query(Post).all())
+    assert session.query(Vote).count() == 0
+
+def test_vote_batch_last_entry_wins(authorized_client, session, test_posts):
+    post_id = test_posts[0].id
+    response = authorized_client.post("/vote/batch", json=[
+        {"post_id":post_id, "dir":1},
+        {"post_id":post_id, "dir":0},
+        {"post_id":post_id, "dir":1},
+    ])
+    assert [r["status"] for r in response.json()] == ["superseded", "superseded", "added"]
+    session.expire_all()
+    assert session.get(Post, post_id).vote_count == 1
+
+def test_vote_batch_too_large(authorized_client, test_posts):
+    votes = [{"post_id":test_posts[0].id, "dir":1}] * (settings.vote_batch_max_size + 1)
+    response = authorized_client.post("/vote/batch", json=votes)
+    assert response.status_code == 422
+
+def test_vote_batch_unauthorized(client, test_posts):
+    response = client.post("/vote/batch", json=[{"post_id":test_posts[0].id, "dir":1}])
+    assert response.status_code == 401
 
-
-
-
-
-
-
-
-
-
-
-
-
-
+@pytest.fixture
+def buffered_votes(monkeypatch):
+    buffer = VoteBuffer(batch_size=2, flush_interval=60, max_pending=3)
+    monkeypatch.setattr(settings, "vote_buffer_enabled", True)
+    monkeypatch.setattr(vote_router, "vote_buffer", buffer)
+    return buffer
+
+def test_buffered_votes_flushed_in_batches(authorized_client, session, test_posts, buffered_votes):
+    for post in test_posts[:3]:
+        response = authorized_client.post("/vote/", json={"post_id": post.id, "dir": 1})
+        assert response.status_code == 202
+    assert session.query(Vote).count() == 0
+
+    assert asyncio.run(buffered_votes.flush(TestingAsyncSessionLocal)) == 3
+    stats = buffered_votes.stats()
+    assert stats["pending"] == 0
+    assert stats["flushes"] == 2
+    assert stats["applied"] == 3
+    session.expire_all()
+    assert [post.vote_count for post in session.query(Post).order_by(Post.id)] == [1, 1, 1, 0]
+
+def test_buffered_vote_toggles_coalesce(authorized_client, session, test_posts, buffered_votes):
+    post_id = test_posts[0].id
+    for dir in (1, 0, 1):
+        authorized_client.post("/vote/", json={"post_id": post_id, "dir": dir})
+    # A vote for a missing post is dropped at flush time
+    authorized_client.post("/vote/", json={"post_id": 999999, "dir": 1})
+
+    assert buffered_votes.stats()["coalesced"] == 2
+    asyncio.run(buffered_votes.flush(TestingAsyncSessionLocal))
+    assert buffered_votes.stats()["applied"] == 1
+    session.expire_all()
+    assert session.get(Post, post_id).vote_count == 1
+    assert authorized_client.get(f"/posts/{post_id}").json()["votes"] == 1
+
+def test_buffered_votes_backpressure(authorized_client, test_posts, buffered_votes):
+    statuses = [authorized_client.post("/vote/", json={"post_id": post.id, "dir": 1}).status_code for post in test_posts]
+    assert statuses == [202, 202, 202, 503]
+    stats = buffered_votes.stats()
+    assert stats["rejected"] == 1
+    assert stats["pending"] == 3
+
+def test_buffered_votes_requeued_when_flush_fails(buffered_votes):
+    buffered_votes.add(1, 10, 1)
+
+    def broken_session():
+        raise ConnectionError("database is down")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(buffered_votes.flush(broken_session))
+    assert buffered_votes.stats()["pending"] == 1
+    assert buffered_votes.stats()["flush_errors"] == 1
@@ -0,0 +1,34 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app import ranking, utils, warmup
+from app.main import create_app
+from app.models import Post, Vote
+from .conftest import TestingAsyncSessionLocal, async_engine
+
+def test_warm_up_runs_hot_statements_without_writing(session, test_posts, test_vote, statements, monkeypatch):
+    monkeypatch.setattr(warmup, "SessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(warmup, "connections_warmed", 0)
+    statements.clear()
+    asyncio.run(warmup.warm_up(2))
+
+    assert warmup.stats()["connections_warmed"] == 2
+    # Each connection ran the hot feed query and both vote statements
+    assert sum("post_rankings" in s for s in statements) == 2
+    assert sum(s.lstrip().startswith("WITH changed") for s in statements) == 4
+    session.expire_all()
+    assert session.query(Post).count() == len(test_posts)
+    assert session.query(Vote).count() == 1
+    assert session.get(Post, test_posts[0].id).vote_count == 1
+
+def test_ready_after_warmup(session, monkeypatch):
+    monkeypatch.setattr(warmup, "SessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(ranking, "engine", async_engine)
+    monkeypatch.setattr(warmup, "ready", False)
+    app = create_app()
+    assert TestClient(app).get("/ready").status_code == 503
+    with TestClient(app) as client:
+        assert client.get("/ready").json() == {"status": "ready"}
+        # Started by the first hash, and stopped at shutdown
+        utils.hasher._get_executor()
+    assert not warmup.ready
+    assert utils.hasher._executor is None